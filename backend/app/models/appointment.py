@@ -1,4 +1,5 @@
 from app import db
+from app.utils.serializers import ModelSerializer, Field, column_fields
 from datetime import datetime, date, time
 
 class Appointment(db.Model):
@@ -20,22 +21,66 @@ class Appointment(db.Model):
     # Relationships
     billing = db.relationship('Billing', backref='appointment', uselist=False, cascade='all, delete-orphan')
     
+    # Keyset pagination and per-doctor/per-patient day lookups walk these in order
+    __table_args__ = (
+        db.Index('ix_appointments_date_time_id', 'appointment_date', 'appointment_time', 'id'),
+        db.Index('ix_appointments_doctor_date_time', 'doctor_id', 'appointment_date', 'appointment_time'),
+        db.Index('ix_appointments_patient_date_time', 'patient_id', 'appointment_date', 'appointment_time'),
+        # Covering indexes for the dashboard's per-status counts
+        db.Index('ix_appointments_status', 'status'),
+        db.Index('ix_appointments_doctor_status', 'doctor_id', 'status'),
+        db.Index('ix_appointments_patient_status', 'patient_id', 'status'),
+    )
+    
+    def to_dict(self, fields=None):
+        return appointment_serializer(self, fields)
+    
+    def __repr__(self):
+        return f'<Appointment {self.id}: {self.patient_id} -> {self.doctor_id}>'
+
+def _name_of(user):
+    return f"{user.first_name} {user.last_name}" if user else None
+
+# Names come from the patient and doctor relationships here; list views
+# load them with a join instead (see ``services.appointments``)
+appointment_serializer = ModelSerializer(
+    column_fields(Appointment, [
+        'id', 'patient_id', 'doctor_id', 'appointment_date', 'appointment_time',
+        'duration_minutes', 'status', 'reason', 'notes', 'created_at', 'updated_at'
+    ]) + [
+        ('patient_name', Field((), '_name_of(row.patient)')),
+        ('doctor_name', Field((), '_name_of(row.doctor)'))
+    ],
+    helpers={'_name_of': _name_of}
+)
+
+class SlotHold(db.Model):
+    __tablename__ = 'slot_holds'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    duration_minutes = db.Column(db.Integer, default=30)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Reaped by range delete on this index
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_slot_holds_doctor_date', 'doctor_id', 'appointment_date'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
-            'patient_id': self.patient_id,
             'doctor_id': self.doctor_id,
-            'patient_name': f"{self.patient.first_name} {self.patient.last_name}" if self.patient else None,
-            'doctor_name': f"{self.doctor.first_name} {self.doctor.last_name}" if self.doctor else None,
+            'user_id': self.user_id,
             'appointment_date': self.appointment_date.isoformat(),
             'appointment_time': self.appointment_time.strftime('%H:%M'),
             'duration_minutes': self.duration_minutes,
-            'status': self.status,
-            'reason': self.reason,
-            'notes': self.notes,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'expires_at': self.expires_at.isoformat(),
+            'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
     def __repr__(self):
-        return f'<Appointment {self.id}: {self.patient_id} -> {self.doctor_id}>'
+        return f'<SlotHold {self.id}: {self.doctor_id} {self.appointment_date} {self.appointment_time}>'
@@ -1,4 +1,5 @@
 from app import db
+from app.utils.serializers import ModelSerializer, column_fields
 from datetime import datetime
 from decimal import Decimal
 
@@ -28,23 +29,15 @@ class Billing(db.Model):
         self.total_amount = self.consultation_fee + self.additional_charges + self.tax_amount - self.discount
         return self.total_amount
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'appointment_id': self.appointment_id,
-            'patient_id': self.patient_id,
-            'total_amount': float(self.total_amount),
-            'consultation_fee': float(self.consultation_fee),
-            'additional_charges': float(self.additional_charges),
-            'discount': float(self.discount),
-            'tax_amount': float(self.tax_amount),
-            'status': self.status,
-            'payment_method': self.payment_method,
-            'payment_reference': self.payment_reference,
-            'notes': self.notes,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+    def to_dict(self, fields=None):
+        return billing_serializer(self, fields)
     
     def __repr__(self):
         return f'<Billing {self.id}: ${self.total_amount}>'
+
+# Money columns are sent as floats
+billing_serializer = ModelSerializer(column_fields(Billing, [
+    'id', 'appointment_id', 'patient_id', 'total_amount', 'consultation_fee',
+    'additional_charges', 'discount', 'tax_amount', 'status', 'payment_method',
+    'payment_reference', 'notes', 'created_at', 'updated_at'
+]))
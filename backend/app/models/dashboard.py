@@ -0,0 +1,26 @@
+from app import db
+from datetime import datetime
+
+class DashboardCounter(db.Model):
+    __tablename__ = 'dashboard_counters'
+    
+    # e.g. ('appointments', 3, 'scheduled'), ('doctor', 12, 'completed'), ('resources', 0, 'low_stock')
+    scope = db.Column(db.String(20), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True, default=0)
+    name = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DashboardCounter {self.scope}:{self.scope_id}:{self.name}={self.value}>'
+
+class VersionStamp(db.Model):
+    __tablename__ = 'version_stamps'
+    
+    # e.g. 'resources', 'doctors', 'appointments:patient:7'; bumped in the
+    # same transaction as every write that changes what the name covers
+    name = db.Column(db.String(60), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<VersionStamp {self.name}={self.version}>'
@@ -0,0 +1,48 @@
+from app import db
+from datetime import datetime
+
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    type = db.Column(db.String(30), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.String(255), nullable=False)
+    priority = db.Column(db.Enum('low', 'medium', 'high'), default='medium', nullable=False)
+    event_date = db.Column(db.Date, nullable=True)
+    # Set for generated notifications so re-running the generator inserts nothing twice
+    dedupe_key = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Pruned by range delete on this index
+    
+    # A user's feed is read newest first on (user_id, id)
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_id', 'user_id', 'id'),
+        db.UniqueConstraint('user_id', 'dedupe_key', name='uq_notifications_user_dedupe'),
+    )
+    
+    def to_dict(self, last_read_id=0):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'title': self.title,
+            'message': self.message,
+            'date': self.event_date.isoformat() if self.event_date else self.created_at.isoformat(),
+            'priority': self.priority,
+            'read': self.id <= (last_read_id or 0),
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<Notification {self.id}: {self.type} -> {self.user_id}>'
+
+class NotificationCursor(db.Model):
+    __tablename__ = 'notification_cursors'
+    
+    # Everything in the user's feed up to last_read_id has been read
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    last_read_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationCursor {self.user_id}: {self.last_read_id}>'
@@ -1,4 +1,5 @@
 from app import db
+from app.utils.serializers import ModelSerializer, column_fields
 from datetime import datetime
 
 class Resource(db.Model):
@@ -22,23 +23,12 @@ class Resource(db.Model):
     # Relationships
     transactions = db.relationship('ResourceTransaction', backref='resource', lazy='dynamic')
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'resource_type': self.resource_type,
-            'category': self.category,
-            'total_quantity': self.total_quantity,
-            'available_quantity': self.available_quantity,
-            'unit': self.unit,
-            'description': self.description,
-            'location': self.location,
-            'expiry_date': self.expiry_date.isoformat() if self.expiry_date else None,
-            'min_threshold': self.min_threshold,
-            'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+    __table_args__ = (
+        db.Index('ix_resources_type_expiry', 'resource_type', 'expiry_date'),
+    )
+    
+    def to_dict(self, fields=None):
+        return resource_serializer(self, fields)
     
     def is_low_stock(self):
         return self.available_quantity <= self.min_threshold
@@ -46,6 +36,12 @@ class Resource(db.Model):
     def __repr__(self):
         return f'<Resource {self.name}: {self.available_quantity}/{self.total_quantity}>'
 
+resource_serializer = ModelSerializer(column_fields(Resource, [
+    'id', 'name', 'resource_type', 'category', 'total_quantity', 'available_quantity',
+    'unit', 'description', 'location', 'expiry_date', 'min_threshold', 'is_active',
+    'created_at', 'updated_at'
+]))
+
 class ResourceTransaction(db.Model):
     __tablename__ = 'resource_transactions'
     
@@ -58,17 +54,13 @@ class ResourceTransaction(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'resource_id': self.resource_id,
-            'transaction_type': self.transaction_type,
-            'quantity': self.quantity,
-            'reason': self.reason,
-            'reference_id': self.reference_id,
-            'created_by': self.created_by,
-            'created_at': self.created_at.isoformat()
-        }
+    def to_dict(self, fields=None):
+        return transaction_serializer(self, fields)
     
     def __repr__(self):
         return f'<ResourceTransaction {self.id}: {self.transaction_type} {self.quantity}>'
+
+transaction_serializer = ModelSerializer(column_fields(ResourceTransaction, [
+    'id', 'resource_id', 'transaction_type', 'quantity', 'reason', 'reference_id',
+    'created_by', 'created_at'
+]))
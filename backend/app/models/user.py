@@ -1,6 +1,7 @@
 from app import db
+from app.utils.serializers import ModelSerializer, column_fields
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.services.passwords import hash_password, verify_password
 from flask_jwt_extended import create_access_token, create_refresh_token
 
 class User(db.Model):
@@ -14,6 +15,8 @@ class User(db.Model):
     phone = db.Column(db.String(20), nullable=True)
     role = db.Column(db.Enum('patient', 'doctor', 'admin'), nullable=False, default='patient')
     is_active = db.Column(db.Boolean, default=True)
+    # Bumped on activate/deactivate; tokens carrying an older version are rejected
+    auth_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -33,35 +36,45 @@ class User(db.Model):
     appointments_as_doctor = db.relationship('Appointment', foreign_keys='Appointment.doctor_id', backref='doctor', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password, upgrading the stored hash when the hash settings changed"""
+        matches, needs_rehash = verify_password(self.password_hash, password)
+        if needs_rehash:
+            self.password_hash = hash_password(password)
+        return matches
     
     def generate_tokens(self):
-        access_token = create_access_token(identity=self.id)
-        refresh_token = create_refresh_token(identity=self.id)
+        claims = {'role': self.role, 'ver': self.auth_version}
+        access_token = create_access_token(identity=str(self.id), additional_claims=claims)
+        refresh_token = create_refresh_token(identity=str(self.id), additional_claims=claims)
         return access_token, refresh_token
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'email': self.email,
-            'first_name': self.first_name,
-            'last_name': self.last_name,
-            'phone': self.phone,
-            'role': self.role,
-            'is_active': self.is_active,
-            'specialty': self.specialty,
-            'license_number': self.license_number,
-            'experience_years': self.experience_years,
-            'date_of_birth': self.date_of_birth.isoformat() if self.date_of_birth else None,
-            'gender': self.gender,
-            'address': self.address,
-            'emergency_contact': self.emergency_contact,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+    def to_dict(self, fields=None):
+        return user_serializer(self, fields)
     
     def __repr__(self):
         return f'<User {self.email}>'
+
+# Fields of a user's public representation; password_hash is never exposed
+user_serializer = ModelSerializer(column_fields(User, [
+    'id', 'email', 'first_name', 'last_name', 'phone', 'role', 'is_active',
+    'specialty', 'license_number', 'experience_years', 'date_of_birth', 'gender',
+    'address', 'emergency_contact', 'created_at', 'updated_at'
+]))
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Pruned by range delete on this index
+    # Workers sync their in-memory blocklist by re-reading a trailing window of
+    # revoked_at, so a row committed after a later one is still picked up
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
@@ -1,19 +1,42 @@
+import click
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from app.models.appointment import Appointment
 from app.models.user import User
+from app.services.appointments import scope_appointments, project_appointments, appointment_list_serializer, APPOINTMENT_SORT_KEY
+from app.services import counters, notifications, versions
+from app.services.directory import doctor_directory
+from app.services.availability import availability, ACTIVE_STATUSES, SLOT_LABELS, DAY_START_MINUTES, SLOT_MINUTES
+from app.services.booking import book_appointment, book_series, expand_recurrence, place_hold, release_hold, reclaim_interval, SlotConflict, BookingBusy, HoldNotFound
+from app.services.importer import iter_records, import_appointments, IMPORT_FORMATS, BATCH_SIZE
+from app.utils.pagination import keyset_paginate, approximate_total, MAX_PER_PAGE
+from app.utils.validators import validate_appointment_status
 from app import db
-from datetime import datetime, date
+from app.utils.auth import load_current_user
+from app.utils.conditional import conditional
+from datetime import datetime, date, timedelta
 from sqlalchemy import and_, or_
 
 appointments_bp = Blueprint('appointments', __name__)
 
+# Longest window accepted by a multi-day available-slots request
+MAX_RANGE_DAYS = 62
+
+# Longest single booking accepted
+MAX_DURATION_MINUTES = 8 * 60
+
+# Row errors echoed back by the import endpoint; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+# Bounds for the cross-doctor earliest slot search
+MAX_SEARCH_DAYS = 31
+MAX_SEARCH_RESULTS = 50
+
 @appointments_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_appointments():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -24,14 +47,11 @@ def get_appointments():
         status = request.args.get('status')
         date_filter = request.args.get('date')
         
-        # Build query based on user role
-        query = Appointment.query
+        if not 1 <= per_page <= MAX_PER_PAGE:
+            return jsonify({'error': f'per_page must be between 1 and {MAX_PER_PAGE}'}), 400
         
-        if user.role == 'patient':
-            query = query.filter_by(patient_id=user_id)
-        elif user.role == 'doctor':
-            query = query.filter_by(doctor_id=user_id)
-        # Admin can see all appointments
+        # Build query based on user role
+        query = scope_appointments(Appointment.query, user)
         
         # Apply filters
         if status:
@@ -44,35 +64,42 @@ def get_appointments():
             except ValueError:
                 return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         
-        # Get appointments with pagination
-        appointments = query.paginate(
+        # ?fields=id,status,... loads and returns only those columns
+        try:
+            fields = appointment_list_serializer.select(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        serialize = appointment_list_serializer.extractor(fields)
+        rows = project_appointments(query, fields)
+        
+        # Opt-in keyset pagination: ?cursor= (empty for the first page) skips
+        # the COUNT and OFFSET, so every page costs the same
+        if 'cursor' in request.args:
+            try:
+                items, next_cursor = keyset_paginate(
+                    rows, APPOINTMENT_SORT_KEY, request.args.get('cursor'), per_page
+                )
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            
+            response = {
+                'appointments': [serialize(item) for item in items],
+                'next_cursor': next_cursor,
+                'per_page': per_page
+            }
+            if request.args.get('include_total') in ('1', 'true'):
+                response['total'] = approximate_total(('appointments', user.role, user.id, status, date_filter), query)
+            return jsonify(response), 200
+        
+        # Get appointments with pagination; names come from the same statement
+        appointments = rows.paginate(
             page=page, 
             per_page=per_page, 
             error_out=False
         )
         
         # Format response
-        appointments_data = []
-        for appointment in appointments.items:
-            # Get patient and doctor names
-            patient = User.query.get(appointment.patient_id)
-            doctor = User.query.get(appointment.doctor_id)
-            
-            appointments_data.append({
-                'id': appointment.id,
-                'patient_id': appointment.patient_id,
-                'doctor_id': appointment.doctor_id,
-                'patient_name': f"{patient.first_name} {patient.last_name}" if patient else "Unknown",
-                'doctor_name': f"{doctor.first_name} {doctor.last_name}" if doctor else "Unknown",
-                'appointment_date': appointment.appointment_date.isoformat(),
-                'appointment_time': appointment.appointment_time,
-                'duration_minutes': appointment.duration_minutes,
-                'status': appointment.status,
-                'reason': appointment.reason,
-                'notes': appointment.notes,
-                'created_at': appointment.created_at.isoformat() if appointment.created_at else None,
-                'updated_at': appointment.updated_at.isoformat() if appointment.updated_at else None
-            })
+        appointments_data = [serialize(row) for row in appointments.items]
         
         return jsonify({
             'appointments': appointments_data,
@@ -89,7 +116,6 @@ def get_appointments():
 @jwt_required()
 def create_appointment():
     try:
-        user_id = get_jwt_identity()
         data = request.get_json()
         
         # Validate required fields
@@ -99,8 +125,8 @@ def create_appointment():
                 return jsonify({'error': f'{field} is required'}), 400
         
         # Check if user is patient or admin
-        user = User.query.get(user_id)
-        if user.role not in ['patient', 'admin']:
+        user = load_current_user()
+        if not user or user.role not in ['patient', 'admin']:
             return jsonify({'error': 'Only patients can book appointments'}), 403
         
         # Validate doctor exists
@@ -108,20 +134,35 @@ def create_appointment():
         if not doctor or doctor.role != 'doctor':
             return jsonify({'error': 'Invalid doctor'}), 400
         
-        # Create appointment
-        appointment = Appointment(
-            patient_id=user_id if user.role == 'patient' else data.get('patient_id', user_id),
-            doctor_id=data['doctor_id'],
-            appointment_date=datetime.strptime(data['appointment_date'], '%Y-%m-%d').date(),
-            appointment_time=data['appointment_time'],
-            duration_minutes=data.get('duration_minutes', 30),
-            status='scheduled',
-            reason=data['reason'],
-            notes=data.get('notes', '')
-        )
+        try:
+            appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
+            appointment_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
+            duration_minutes = int(data.get('duration_minutes', 30))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid date or time. Use YYYY-MM-DD and HH:MM'}), 400
         
-        db.session.add(appointment)
-        db.session.commit()
+        if not 0 < duration_minutes <= MAX_DURATION_MINUTES:
+            return jsonify({'error': f'duration_minutes must be between 1 and {MAX_DURATION_MINUTES}'}), 400
+        
+        # Create appointment; bookings of the same doctor-day are serialized and
+        # any [start, start + duration) overlap is rejected
+        try:
+            appointment = book_appointment(
+                hold_id=data.get('hold_id'),
+                holder_id=user.id,
+                patient_id=user.id if user.role == 'patient' else data.get('patient_id', user.id),
+                doctor_id=doctor.id,
+                appointment_date=appointment_date,
+                appointment_time=appointment_time,
+                duration_minutes=duration_minutes,
+                status='scheduled',
+                reason=data['reason'],
+                notes=data.get('notes', '')
+            )
+        except SlotConflict:
+            return jsonify({'error': 'The requested time overlaps an existing appointment'}), 409
+        except BookingBusy:
+            return jsonify({'error': 'This doctor is being booked by someone else, please retry'}), 409
         
         return jsonify({
             'message': 'Appointment created successfully',
@@ -132,23 +173,208 @@ def create_appointment():
         db.session.rollback()
         return jsonify({'error': 'An error occurred while creating appointment'}), 500
 
+@appointments_bp.route('/series', methods=['POST'])
+@jwt_required()
+def create_appointment_series():
+    try:
+        data = request.get_json() or {}
+        
+        # Validate required fields
+        required_fields = ['doctor_id', 'start_date', 'appointment_time', 'reason', 'recurrence']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({'error': f'{field} is required'}), 400
+        
+        # Check if user is patient or admin
+        user = load_current_user()
+        if not user or user.role not in ['patient', 'admin']:
+            return jsonify({'error': 'Only patients can book appointments'}), 403
+        
+        # Validate doctor exists
+        doctor = User.query.get(data['doctor_id'])
+        if not doctor or doctor.role != 'doctor':
+            return jsonify({'error': 'Invalid doctor'}), 400
+        
+        recurrence = data['recurrence']
+        try:
+            start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+            appointment_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
+            duration_minutes = int(data.get('duration_minutes', 30))
+            until = datetime.strptime(recurrence['until'], '%Y-%m-%d').date() if recurrence.get('until') else None
+            dates = expand_recurrence(
+                start_date,
+                recurrence.get('frequency', 'weekly'),
+                interval=int(recurrence.get('interval', 1)),
+                count=int(recurrence['count']) if recurrence.get('count') else None,
+                until=until
+            )
+        except (TypeError, ValueError, AttributeError) as e:
+            return jsonify({'error': f'Invalid series: {e}'}), 400
+        
+        if not 0 < duration_minutes <= MAX_DURATION_MINUTES:
+            return jsonify({'error': f'duration_minutes must be between 1 and {MAX_DURATION_MINUTES}'}), 400
+        
+        try:
+            booked_dates, conflicting_dates = book_series(
+                dates,
+                hold_id=data.get('hold_id'),
+                holder_id=user.id,
+                patient_id=user.id if user.role == 'patient' else data.get('patient_id', user.id),
+                doctor_id=doctor.id,
+                appointment_time=appointment_time,
+                duration_minutes=duration_minutes,
+                status='scheduled',
+                reason=data['reason'],
+                notes=data.get('notes', '')
+            )
+        except BookingBusy:
+            return jsonify({'error': 'This doctor is being booked by someone else, please retry'}), 409
+        
+        return jsonify({
+            'message': f'{len(booked_dates)} of {len(dates)} appointments created',
+            'booked': [day.isoformat() for day in booked_dates],
+            'conflicts': [day.isoformat() for day in conflicting_dates]
+        }), 201 if booked_dates else 409
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while creating appointment series'}), 500
+
+@appointments_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_appointments_upload():
+    try:
+        user = load_current_user()
+        
+        if not user or user.role != 'admin':
+            return jsonify({'error': 'Access denied. Admin role required'}), 403
+        
+        # Format from ?format= or the Content-Type of the raw request body
+        fmt = request.args.get('format')
+        if not fmt:
+            fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f'format must be one of {", ".join(IMPORT_FORMATS)}'}), 400
+        
+        errors = []
+        error_count = 0
+        
+        def on_error(row_number, message):
+            nonlocal error_count
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'row': row_number, 'error': message})
+        
+        batch_size = request.args.get('batch_size', BATCH_SIZE, type=int)
+        imported, processed = import_appointments(
+            iter_records(request.stream, fmt), on_error, batch_size=max(batch_size, 1)
+        )
+        
+        return jsonify({
+            'imported': imported,
+            'processed': processed,
+            'failed': error_count,
+            'errors': errors
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while importing appointments'}), 500
+
+@appointments_bp.cli.command('import')
+@click.argument('path', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='Input format; guessed from the file extension when omitted')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+def import_appointments_command(path, fmt, batch_size):
+    """Stream appointments from a CSV or NDJSON file into the database"""
+    if fmt is None:
+        fmt = 'csv' if path.name.endswith('.csv') else 'ndjson'
+    
+    def on_error(row_number, message):
+        click.echo(f'row {row_number}: {message}', err=True)
+    
+    imported, processed = import_appointments(iter_records(path, fmt), on_error, batch_size=batch_size)
+    click.echo(f'Imported {imported} of {processed} rows')
+
+@appointments_bp.route('/holds', methods=['POST'])
+@jwt_required()
+def create_hold():
+    try:
+        user = load_current_user()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if user.role not in ['patient', 'admin']:
+            return jsonify({'error': 'Only patients can book appointments'}), 403
+        
+        data = request.get_json() or {}
+        for field in ['doctor_id', 'appointment_date', 'appointment_time']:
+            if not data.get(field):
+                return jsonify({'error': f'{field} is required'}), 400
+        
+        doctor = User.query.get(data['doctor_id'])
+        if not doctor or doctor.role != 'doctor':
+            return jsonify({'error': 'Invalid doctor'}), 400
+        
+        try:
+            appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
+            appointment_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
+            duration_minutes = int(data.get('duration_minutes', 30))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid date or time. Use YYYY-MM-DD and HH:MM'}), 400
+        
+        if not 0 < duration_minutes <= MAX_DURATION_MINUTES:
+            return jsonify({'error': f'duration_minutes must be between 1 and {MAX_DURATION_MINUTES}'}), 400
+        
+        try:
+            hold = place_hold(user.id, doctor.id, appointment_date, appointment_time, duration_minutes)
+        except SlotConflict:
+            return jsonify({'error': 'The requested time is no longer available'}), 409
+        except BookingBusy:
+            return jsonify({'error': 'This doctor is being booked by someone else, please retry'}), 409
+        
+        return jsonify({'hold': hold.to_dict()}), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while holding the slot'}), 500
+
+@appointments_bp.route('/holds/<int:hold_id>', methods=['DELETE'])
+@jwt_required()
+def delete_hold(hold_id):
+    try:
+        user = load_current_user()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        try:
+            release_hold(user.id, hold_id)
+        except HoldNotFound:
+            return jsonify({'error': 'Hold not found'}), 404
+        
+        return jsonify({'message': 'Hold released successfully'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while releasing the hold'}), 500
+
 @appointments_bp.route('/doctors', methods=['GET'])
 @jwt_required()
+@conditional(lambda user: (versions.DOCTORS,), current=doctor_directory.versions)
 def get_doctors():
     try:
-        doctors = User.query.filter_by(role='doctor', is_active=True).all()
-        
-        doctors_data = []
-        for doctor in doctors:
-            doctors_data.append({
-                'id': doctor.id,
-                'first_name': doctor.first_name,
-                'last_name': doctor.last_name,
-                'specialty': doctor.specialty,
-                'experience_years': doctor.experience_years
-            })
+        # Served from this worker's copy of the directory; ?specialty= narrows it
+        snapshot = doctor_directory.snapshot()
+        specialty = request.args.get('specialty')
+        doctors = doctor_directory.doctors(specialty) if specialty else snapshot.doctors
         
-        return jsonify({'doctors': doctors_data}), 200
+        return jsonify({
+            'doctors': list(doctors),
+            'specialties': list(snapshot.specialties)
+        }), 200
         
     except Exception as e:
         return jsonify({'error': 'An error occurred while fetching doctors'}), 500
@@ -159,6 +385,8 @@ def get_available_slots():
     try:
         doctor_id = request.args.get('doctor_id', type=int)
         date_str = request.args.get('date')
+        end_date_str = request.args.get('end_date')
+        duration = request.args.get('duration', SLOT_MINUTES, type=int)
         
         if not doctor_id or not date_str:
             return jsonify({'error': 'doctor_id and date are required'}), 400
@@ -169,35 +397,180 @@ def get_available_slots():
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
         
-        # Get existing appointments for the doctor on that date
-        existing_appointments = Appointment.query.filter(
-            and_(
-                Appointment.doctor_id == doctor_id,
-                Appointment.appointment_date == appointment_date,
-                Appointment.status.in_(['scheduled', 'confirmed'])
-            )
-        ).all()
-        
-        # Generate available time slots (9 AM to 5 PM, 30-minute intervals)
-        available_slots = []
-        start_time = 9  # 9 AM
-        end_time = 17   # 5 PM
-        
-        for hour in range(start_time, end_time):
-            for minute in [0, 30]:
-                time_str = f"{hour:02d}:{minute:02d}"
-                
-                # Check if this slot is available
-                is_available = True
-                for appointment in existing_appointments:
-                    if appointment.appointment_time == time_str:
-                        is_available = False
-                        break
-                
-                if is_available:
-                    available_slots.append(time_str)
+        if not 0 < duration <= MAX_DURATION_MINUTES:
+            return jsonify({'error': f'duration must be between 1 and {MAX_DURATION_MINUTES}'}), 400
+        
+        # Optional end_date turns this into a multi-day range request
+        if end_date_str:
+            try:
+                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+            
+            if end_date < appointment_date or (end_date - appointment_date).days >= MAX_RANGE_DAYS:
+                return jsonify({'error': f'end_date must be within {MAX_RANGE_DAYS} days after date'}), 400
+            
+            slots_by_day = availability.free_slots_range(doctor_id, appointment_date, end_date, duration)
+            return jsonify({
+                'available_slots': {day.isoformat(): slots for day, slots in slots_by_day.items()}
+            }), 200
+        
+        # Starts between 9 AM and 5 PM with room for the requested duration
+        available_slots = availability.free_slots(doctor_id, appointment_date, duration)
         
         return jsonify({'available_slots': available_slots}), 200
         
     except Exception as e:
         return jsonify({'error': 'An error occurred while fetching available slots'}), 500
+
+@appointments_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_earliest_slots():
+    try:
+        specialty = request.args.get('specialty', '').strip()
+        start_str = request.args.get('start_date')
+        end_str = request.args.get('end_date')
+        duration = request.args.get('duration', 30, type=int)
+        limit = request.args.get('limit', 10, type=int)
+        
+        if not specialty:
+            return jsonify({'error': 'specialty is required'}), 400
+        
+        try:
+            start_date = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else date.today()
+            end_date = datetime.strptime(end_str, '%Y-%m-%d').date() if end_str else start_date + timedelta(days=MAX_SEARCH_DAYS - 1)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        if end_date < start_date or (end_date - start_date).days >= MAX_SEARCH_DAYS:
+            return jsonify({'error': f'end_date must be within {MAX_SEARCH_DAYS} days after start_date'}), 400
+        
+        if duration <= 0 or limit <= 0:
+            return jsonify({'error': 'duration and limit must be positive'}), 400
+        limit = min(limit, MAX_SEARCH_RESULTS)
+        
+        doctors_by_id = {doctor['id']: doctor for doctor in doctor_directory.doctors(specialty)}
+        
+        # Slots that already started today are not offered
+        now = datetime.now()
+        not_before = None
+        if start_date <= now.date():
+            minutes_into_day = now.hour * 60 + now.minute - DAY_START_MINUTES
+            not_before = (now.date(), max(-(-minutes_into_day // SLOT_MINUTES), 0))
+        
+        matches = availability.earliest_slots(
+            sorted(doctors_by_id), start_date, end_date, duration, limit, not_before=not_before
+        )
+        
+        slots = []
+        for slot_date, slot_index, doctor_id in matches:
+            doctor = doctors_by_id[doctor_id]
+            slots.append({
+                'doctor_id': doctor_id,
+                'doctor_name': f"{doctor['first_name']} {doctor['last_name']}",
+                'specialty': doctor['specialty'],
+                'date': slot_date.isoformat(),
+                'time': SLOT_LABELS[slot_index],
+                'duration_minutes': duration
+            })
+        
+        return jsonify({'slots': slots}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while searching available slots'}), 500
+
+# PUT and DELETE /<id> are the status changes the frontend's appointment
+# screens call (updateAppointment and cancelAppointment in services/api.ts).
+# A status change frees or takes a slot, so each one must also refresh the
+# availability cache and run the booking overlap check when it reactivates.
+def _apply_update(appointment, user, data, status):
+    if status:
+        counters.apply(counters.appointment_deltas(
+            appointment.doctor_id, appointment.patient_id, appointment.status, status
+        ))
+        changed = appointment.status != status
+        appointment.status = status
+        if changed:
+            notifications.appointment_status_changed(appointment, user)
+    
+    if 'notes' in data and user.role != 'patient':
+        appointment.notes = data['notes']
+    
+    versions.bump(*versions.appointment_stamps(appointment.doctor_id, appointment.patient_id))
+    db.session.commit()
+
+@appointments_bp.route('/<int:appointment_id>', methods=['PUT'])
+@jwt_required()
+def update_appointment(appointment_id):
+    try:
+        user = load_current_user()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        appointment = scope_appointments(Appointment.query, user).filter(
+            Appointment.id == appointment_id
+        ).first()
+        if not appointment:
+            return jsonify({'error': 'Appointment not found'}), 404
+        
+        data = request.get_json() or {}
+        status = data.get('status')
+        
+        if status:
+            if not validate_appointment_status(status):
+                return jsonify({'error': 'Invalid status'}), 400
+            
+            # Patients may only cancel their own appointments
+            if user.role == 'patient' and status != 'cancelled':
+                return jsonify({'error': 'Patients can only cancel appointments'}), 403
+        
+        # Reactivating takes the slot again, so it is checked like a new booking
+        if status in ACTIVE_STATUSES and appointment.status not in ACTIVE_STATUSES:
+            try:
+                with reclaim_interval(appointment):
+                    _apply_update(appointment, user, data, status)
+            except SlotConflict:
+                return jsonify({'error': 'The appointment time now overlaps another appointment'}), 409
+            except BookingBusy:
+                return jsonify({'error': 'This doctor is being booked by someone else, please retry'}), 409
+        else:
+            _apply_update(appointment, user, data, status)
+            availability.invalidate(appointment.doctor_id, appointment.appointment_date)
+        
+        return jsonify({'message': 'Appointment updated successfully'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while updating appointment'}), 500
+
+@appointments_bp.route('/<int:appointment_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_appointment(appointment_id):
+    try:
+        user = load_current_user()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        appointment = scope_appointments(Appointment.query, user).filter(
+            Appointment.id == appointment_id
+        ).first()
+        if not appointment:
+            return jsonify({'error': 'Appointment not found'}), 404
+        
+        counters.apply(counters.appointment_deltas(
+            appointment.doctor_id, appointment.patient_id, appointment.status, 'cancelled'
+        ))
+        if appointment.status != 'cancelled':
+            appointment.status = 'cancelled'
+            notifications.appointment_status_changed(appointment, user)
+        versions.bump(*versions.appointment_stamps(appointment.doctor_id, appointment.patient_id))
+        db.session.commit()
+        availability.invalidate(appointment.doctor_id, appointment.appointment_date)
+        
+        return jsonify({'message': 'Appointment cancelled successfully'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while cancelling appointment'}), 500
@@ -1,13 +1,19 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, decode_token
+from sqlalchemy.exc import IntegrityError
 from app.models.user import User
 from app import db
 from app.utils.validators import validate_email, validate_password
+from app.utils.auth import create_user_tokens, load_current_user, revoke_token
+from app.services.passwords import HashingBusy
+from app.services import versions
+from app.services.directory import doctor_directory
+from app.utils.ratelimit import rate_limit
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit(ip='20/minute', email='5/minute')
 def login():
     try:
         data = request.get_json()
@@ -21,14 +27,18 @@ def login():
         # Find user by email
         user = User.query.filter_by(email=email).first()
         
-        if not user or not check_password_hash(user.password, password):
+        if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
         if not user.is_active:
             return jsonify({'error': 'Account is deactivated'}), 401
         
-        # Create access token
-        access_token = create_access_token(identity=user.id)
+        # Persist a hash upgraded by check_password
+        if user in db.session.dirty:
+            db.session.commit()
+        
+        # Create access and refresh tokens
+        access_token, refresh_token = create_user_tokens(user)
         
         return jsonify({
             'user': {
@@ -39,13 +49,19 @@ def login():
                 'role': user.role,
                 'is_active': user.is_active
             },
-            'access_token': access_token
+            'access_token': access_token,
+            'refresh_token': refresh_token
         }), 200
         
+    except HashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Too many sign-ins in progress, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'An error occurred during login'}), 500
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit(ip='5/minute')
 def register():
     try:
         data = request.get_json()
@@ -81,13 +97,13 @@ def register():
         # Create new user
         user = User(
             email=email,
-            password=generate_password_hash(password),
             first_name=first_name,
             last_name=last_name,
             role=role,
             phone=data.get('phone', '').strip() if data.get('phone') else None,
             is_active=True
         )
+        user.set_password(password)
         
         # Add doctor-specific fields if role is doctor
         if role == 'doctor':
@@ -103,10 +119,13 @@ def register():
             user.emergency_contact = data.get('emergency_contact', '').strip() if data.get('emergency_contact') else None
         
         db.session.add(user)
+        versions.bump(versions.USERS, *([versions.DOCTORS] if role == 'doctor' else []))
         db.session.commit()
+        if role == 'doctor':
+            doctor_directory.invalidate()
         
-        # Create access token
-        access_token = create_access_token(identity=user.id)
+        # Create access and refresh tokens
+        access_token, refresh_token = create_user_tokens(user)
         
         return jsonify({
             'user': {
@@ -117,9 +136,13 @@ def register():
                 'role': user.role,
                 'is_active': user.is_active
             },
-            'access_token': access_token
+            'access_token': access_token,
+            'refresh_token': refresh_token
         }), 201
         
+    except HashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Too many sign-ups in progress, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'An error occurred during registration'}), 500
@@ -158,9 +181,59 @@ def get_current_user():
     except Exception as e:
         return jsonify({'error': 'An error occurred while fetching user data'}), 500
 
+@auth_bp.route('/refresh', methods=['POST'])
+@rate_limit(ip='30/minute')
+@jwt_required(refresh=True)
+def refresh():
+    try:
+        user = load_current_user()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Rotate: the presented refresh token can only be used once
+        revoke_token(get_jwt())
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Refresh token has already been used'}), 401
+        
+        access_token, refresh_token = create_user_tokens(user)
+        
+        return jsonify({
+            'access_token': access_token,
+            'refresh_token': refresh_token
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while refreshing the token'}), 500
+
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    # In a real application, you would blacklist the token
-    # For now, we'll just return a success message
-    return jsonify({'message': 'Successfully logged out'}), 200
\ No newline at end of file
+    try:
+        revoke_token(get_jwt())
+        db.session.commit()
+        
+        # Revoke the refresh token too when the client sends it
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            try:
+                refresh_claims = decode_token(data['refresh_token'])
+            except Exception:
+                refresh_claims = None
+            if refresh_claims and refresh_claims.get('type') == 'refresh' and refresh_claims['sub'] == get_jwt_identity():
+                try:
+                    revoke_token(refresh_claims)
+                    db.session.commit()
+                except IntegrityError:
+                    # Already revoked by an earlier logout or refresh
+                    db.session.rollback()
+        
+        return jsonify({'message': 'Successfully logged out'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred during logout'}), 500
@@ -1,86 +1,95 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import click
+import json
+import os
+import time
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt
 from app.models.appointment import Appointment
-from app.models.user import User
-from app.models.resource import Resource
+from app.services.appointments import scope_appointments, project_appointments, appointment_list_serializer
+from app.services import counters, notifications, versions
+from app.services.events import broker
+from app.utils.ratelimit import limiter_stats
+from app.utils.pool import pool_stats
+from app.utils.routing import replica_router
 from app import db
-from datetime import datetime, date, timedelta
-from sqlalchemy import func
+from app.utils.auth import load_current_user
+from app.utils.conditional import conditional
+from datetime import date, timedelta
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Comment line sent on idle streams so proxies keep the connection open
+STREAM_HEARTBEAT_SECONDS = 15
+
+# Streams are closed after this long (or at token expiry) and the browser
+# reconnects with Last-Event-ID, re-checking the token
+STREAM_MAX_SECONDS = 3600
+
+# Columns of the upcoming appointments on the stats page
+UPCOMING_FIELDS = ('id', 'patient_name', 'doctor_name', 'appointment_date', 'appointment_time', 'status')
+
+def _stats_stamps(user):
+    # Stats are scoped like the appointment counters they are read from
+    if user.role == 'patient':
+        return (versions.patient_appointments(user.id), versions.COUNTERS)
+    if user.role == 'doctor':
+        return (versions.doctor_appointments(user.id), versions.COUNTERS)
+    return (versions.APPOINTMENTS, versions.RESOURCES, versions.COUNTERS)
+
 @dashboard_bp.route('/stats', methods=['GET'])
 @jwt_required()
+@conditional(_stats_stamps)
 def get_dashboard_stats():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         # Get appointment statistics
-        appointment_query = Appointment.query
-        
-        if user.role == 'patient':
-            appointment_query = appointment_query.filter_by(patient_id=user_id)
-        elif user.role == 'doctor':
-            appointment_query = appointment_query.filter_by(doctor_id=user_id)
-        # Admin can see all appointments
+        appointment_query = scope_appointments(Appointment.query, user)
         
-        # Count appointments by status
-        appointments = appointment_query.all()
+        # Count appointments by status from the maintained counters
+        counts = counters.appointment_counts(user)
         
         stats = {
             'appointments': {
-                'total': len(appointments),
-                'scheduled': len([a for a in appointments if a.status == 'scheduled']),
-                'confirmed': len([a for a in appointments if a.status == 'confirmed']),
-                'completed': len([a for a in appointments if a.status == 'completed']),
-                'cancelled': len([a for a in appointments if a.status == 'cancelled'])
+                'total': sum(counts.values()),
+                'scheduled': counts['scheduled'],
+                'confirmed': counts['confirmed'],
+                'completed': counts['completed'],
+                'cancelled': counts['cancelled']
             }
         }
         
         # Get upcoming appointments (next 7 days)
         upcoming_date = date.today() + timedelta(days=7)
-        upcoming_appointments = appointment_query.filter(
+        upcoming_appointments = project_appointments(appointment_query.filter(
             Appointment.appointment_date >= date.today(),
             Appointment.appointment_date <= upcoming_date,
             Appointment.status.in_(['scheduled', 'confirmed'])
-        ).limit(5).all()
+        ), UPCOMING_FIELDS).limit(5).all()
         
-        upcoming_data = []
-        for appointment in upcoming_appointments:
-            patient = User.query.get(appointment.patient_id)
-            doctor = User.query.get(appointment.doctor_id)
-            
-            upcoming_data.append({
-                'id': appointment.id,
-                'patient_name': f"{patient.first_name} {patient.last_name}" if patient else "Unknown",
-                'doctor_name': f"{doctor.first_name} {doctor.last_name}" if doctor else "Unknown",
-                'appointment_date': appointment.appointment_date.isoformat(),
-                'appointment_time': appointment.appointment_time,
-                'status': appointment.status
-            })
+        serialize = appointment_list_serializer.extractor(UPCOMING_FIELDS)
+        upcoming_data = [serialize(row) for row in upcoming_appointments]
         
         stats['upcoming_appointments'] = upcoming_data
         
         # Get resource statistics (for admin only)
         if user.role == 'admin':
-            resources = Resource.query.all()
+            summary = counters.resource_counts()
             stats['resources'] = {
-                'total_resources': len(resources),
-                'total_beds': len([r for r in resources if r.resource_type == 'bed']),
-                'total_medicines': len([r for r in resources if r.resource_type == 'medicine']),
-                'total_equipment': len([r for r in resources if r.resource_type == 'equipment']),
-                'low_stock_count': len([r for r in resources if r.available_quantity <= r.min_threshold]),
-                'expired_medicines': len([r for r in resources if r.resource_type == 'medicine' and r.expiry_date and r.expiry_date < date.today()])
+                'total_resources': summary['total_resources'],
+                'total_beds': summary['total_beds'],
+                'total_medicines': summary['total_medicines'],
+                'total_equipment': summary['total_equipment'],
+                'low_stock_count': summary['low_stock_count'],
+                'expired_medicines': summary['expired_medicines']
             }
             
             # Bed occupancy
-            bed_resources = Resource.query.filter_by(resource_type='bed').all()
-            total_beds = sum(r.total_quantity for r in bed_resources)
-            occupied_beds = sum(r.total_quantity - r.available_quantity for r in bed_resources)
+            total_beds = summary['bed_capacity']
+            occupied_beds = summary['occupied_beds']
             
             stats['occupancy'] = {
                 'total_beds': total_beds,
@@ -98,78 +107,150 @@ def get_dashboard_stats():
 @jwt_required()
 def get_notifications():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        notifications = []
+        before = request.args.get('before', type=int)
+        since = request.args.get('since', type=int)
+        limit = max(request.args.get('limit', 20, type=int), 1)
         
-        # Get upcoming appointments (next 24 hours)
-        tomorrow = date.today() + timedelta(days=1)
-        upcoming_appointments = Appointment.query.filter(
-            Appointment.appointment_date == tomorrow,
-            Appointment.status.in_(['scheduled', 'confirmed'])
-        )
+        # Reminders and alerts are written ahead of time, so polling is one indexed read
+        feed, last_read_id, has_more = notifications.feed(user.id, before=before, since=since, limit=limit)
         
-        if user.role == 'patient':
-            upcoming_appointments = upcoming_appointments.filter_by(patient_id=user_id)
-        elif user.role == 'doctor':
-            upcoming_appointments = upcoming_appointments.filter_by(doctor_id=user_id)
+        return jsonify({
+            'notifications': [notification.to_dict(last_read_id) for notification in feed],
+            'last_read_id': last_read_id,
+            'unread_count': notifications.unread_count(user.id, last_read_id),
+            'has_more': has_more
+        }), 200
         
-        for appointment in upcoming_appointments:
-            patient = User.query.get(appointment.patient_id)
-            doctor = User.query.get(appointment.doctor_id)
-            
-            if user.role == 'patient':
-                notifications.append({
-                    'type': 'appointment_reminder',
-                    'title': 'Upcoming Appointment',
-                    'message': f'You have an appointment with Dr. {doctor.last_name} tomorrow at {appointment.appointment_time}',
-                    'date': appointment.appointment_date.isoformat(),
-                    'priority': 'medium'
-                })
-            elif user.role == 'doctor':
-                notifications.append({
-                    'type': 'appointment_reminder',
-                    'title': 'Upcoming Appointment',
-                    'message': f'You have an appointment with {patient.first_name} {patient.last_name} tomorrow at {appointment.appointment_time}',
-                    'date': appointment.appointment_date.isoformat(),
-                    'priority': 'medium'
-                })
-        
-        # Get low stock notifications (for admin only)
-        if user.role == 'admin':
-            low_stock_resources = Resource.query.filter(
-                Resource.available_quantity <= Resource.min_threshold
-            ).all()
-            
-            for resource in low_stock_resources:
-                notifications.append({
-                    'type': 'low_stock',
-                    'title': 'Low Stock Alert',
-                    'message': f'{resource.name} is running low. Available: {resource.available_quantity}',
-                    'date': datetime.now().isoformat(),
-                    'priority': 'high'
-                })
-            
-            # Get expired medicines
-            expired_medicines = Resource.query.filter(
-                Resource.resource_type == 'medicine',
-                Resource.expiry_date < date.today()
-            ).all()
-            
-            for medicine in expired_medicines:
-                notifications.append({
-                    'type': 'expired',
-                    'title': 'Expired Medicine',
-                    'message': f'{medicine.name} has expired on {medicine.expiry_date}',
-                    'date': datetime.now().isoformat(),
-                    'priority': 'high'
-                })
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while fetching notifications'}), 500
+
+def _sse(notification):
+    return f"id: {notification['id']}\nevent: notification\ndata: {json.dumps(notification)}\n\n"
+
+@dashboard_bp.route('/notifications/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_notifications():
+    """Push new feed rows as Server-Sent Events.
+
+    EventSource cannot set headers, so the token may also be passed as
+    ``?jwt=``. Resumes after the ``Last-Event-ID`` header or ``?last_event_id=``.
+    """
+    user = load_current_user()
+    
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    user_id = user.id
+    last_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('last_event_id', type=int)
+    deadline = time.time() + STREAM_MAX_SECONDS
+    expires_at = get_jwt().get('exp')
+    if expires_at:
+        deadline = min(deadline, expires_at)
+    # Subscribe before replaying so nothing written in between is missed
+    subscription = broker.subscribe(user_id, current_app._get_current_object())
+    # Idle streams must not pin a pooled connection
+    db.session.remove()
+    
+    def generate():
+        sent_id = last_id
+        try:
+            yield 'retry: 3000\n\n'
+            replay = sent_id is not None
+            while time.time() < deadline:
+                if replay:
+                    rows = notifications.replay(user_id, sent_id)
+                    db.session.remove()
+                    for row in rows:
+                        sent_id = row.id
+                        yield _sse(row.to_dict())
+                    replay = len(rows) == notifications.MAX_FEED_LIMIT
+                    if replay:
+                        continue
+                
+                items, overflowed = subscription.drain(STREAM_HEARTBEAT_SECONDS)
+                if overflowed and sent_id is not None:
+                    replay = True
+                    continue
+                if not items:
+                    yield ': keep-alive\n\n'
+                for item in items:
+                    if sent_id is None or item['id'] > sent_id:
+                        sent_id = item['id']
+                        yield _sse(item)
+        finally:
+            broker.unsubscribe(subscription)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@dashboard_bp.route('/notifications/read', methods=['POST'])
+@jwt_required()
+def mark_notifications_read():
+    try:
+        user = load_current_user()
         
-        return jsonify({'notifications': notifications}), 200
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json() or {}
+        try:
+            last_read_id = int(data['last_read_id'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'last_read_id must be an integer'}), 400
+        
+        return jsonify({'last_read_id': notifications.mark_read(user.id, last_read_id)}), 200
         
     except Exception as e:
-        return jsonify({'error': 'An error occurred while fetching notifications'}), 500
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while updating notifications'}), 500
+
+@dashboard_bp.route('/rate-limits', methods=['GET'])
+@jwt_required()
+def get_rate_limit_stats():
+    try:
+        user = load_current_user()
+        
+        if not user or user.role != 'admin':
+            return jsonify({'error': 'Access denied. Admin role required'}), 403
+        
+        # Counters are per worker process
+        return jsonify({'rate_limits': limiter_stats()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while fetching rate limit stats'}), 500
+
+@dashboard_bp.route('/db-pool', methods=['GET'])
+@jwt_required()
+def get_db_pool_stats():
+    try:
+        user = load_current_user()
+        
+        if not user or user.role != 'admin':
+            return jsonify({'error': 'Access denied. Admin role required'}), 403
+        
+        # Pools and their counters are per worker process
+        return jsonify({'pid': os.getpid(), 'pools': pool_stats(db.engines), 'replicas': replica_router.stats()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'An error occurred while fetching connection pool stats'}), 500
+
+@dashboard_bp.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute the dashboard counters from the appointments and resources tables"""
+    counters.rebuild()
+    versions.bump(versions.COUNTERS)
+    db.session.commit()
+    click.echo('Dashboard counters rebuilt')
+
+@dashboard_bp.cli.command('generate-notifications')
+def generate_notifications_command():
+    """Write tomorrow's reminders and stock alerts into the notification feed; run from cron"""
+    considered = notifications.generate()
+    click.echo(f'Notification feed updated ({considered} candidate notifications)')
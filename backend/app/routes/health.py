@@ -0,0 +1,51 @@
+import hmac
+from flask import Blueprint, Response, current_app, jsonify, request
+from sqlalchemy import text
+from app import db
+from app.utils import metrics
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('/')
+def root():
+    return {
+        'message': 'Healthcare Appointment & Resource Management System (HARMS) API',
+        'version': '1.0.0',
+        'endpoints': {
+            'health': '/api/health',
+            'ready': '/api/ready',
+            'metrics': '/metrics',
+            'auth': '/api/auth',
+            'appointments': '/api/appointments',
+            'dashboard': '/api/dashboard',
+            'resources': '/api/resources',
+            'users': '/api/users'
+        }
+    }
+
+@health_bp.route('/api/health')
+def health_check():
+    """Liveness: the process is serving requests; never touches the database"""
+    return {'status': 'healthy', 'message': 'HARMS API is running'}
+
+@health_bp.route('/api/ready')
+def readiness_check():
+    """Readiness: routes are loaded and the database answers; 503 otherwise"""
+    if not current_app.extensions['harms']['loaded']:
+        return jsonify({'status': 'starting'}), 503
+    try:
+        db.session.execute(text('SELECT 1'))
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning('Readiness check failed: %s', e)
+        return jsonify({'status': 'unavailable', 'database': 'unreachable'}), 503
+    return jsonify({'status': 'ready'}), 200
+
+@health_bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape target covering every worker; bearer METRICS_TOKEN when set"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Invalid metrics token'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
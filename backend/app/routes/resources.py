@@ -1,18 +1,22 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.resource import Resource
+from flask_jwt_extended import jwt_required
+from app.models.resource import Resource, resource_serializer
 from app.models.user import User
 from app import db
+from app.services import counters, notifications, versions
+from app.utils.pagination import keyset_paginate, approximate_total, MAX_PER_PAGE
+from app.utils.auth import load_current_user
+from app.utils.conditional import conditional, admin_only
 from datetime import datetime, date
 
 resources_bp = Blueprint('resources', __name__)
 
 @resources_bp.route('/', methods=['GET'])
 @jwt_required()
+@conditional(admin_only(versions.RESOURCES))
 def get_resources():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -26,12 +30,42 @@ def get_resources():
         per_page = request.args.get('per_page', 10, type=int)
         resource_type = request.args.get('type')
         
+        if not 1 <= per_page <= MAX_PER_PAGE:
+            return jsonify({'error': f'per_page must be between 1 and {MAX_PER_PAGE}'}), 400
+        
         # Build query
         query = Resource.query
         
         if resource_type:
             query = query.filter_by(resource_type=resource_type)
         
+        # ?fields=id,name,... loads and returns only those columns
+        try:
+            fields = resource_serializer.select(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        serialize = resource_serializer.extractor(fields)
+        query = query.with_entities(*resource_serializer.columns(fields))
+        
+        # Opt-in keyset pagination: ?cursor= (empty for the first page) skips
+        # the COUNT and OFFSET, so every page costs the same
+        if 'cursor' in request.args:
+            try:
+                items, next_cursor = keyset_paginate(
+                    query, (Resource.id,), request.args.get('cursor'), per_page
+                )
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            
+            response = {
+                'resources': [serialize(item) for item in items],
+                'next_cursor': next_cursor,
+                'per_page': per_page
+            }
+            if request.args.get('include_total') in ('1', 'true'):
+                response['total'] = approximate_total(('resources', resource_type), query)
+            return jsonify(response), 200
+        
         # Get resources with pagination
         resources = query.paginate(
             page=page, 
@@ -40,24 +74,7 @@ def get_resources():
         )
         
         # Format response
-        resources_data = []
-        for resource in resources.items:
-            resources_data.append({
-                'id': resource.id,
-                'name': resource.name,
-                'resource_type': resource.resource_type,
-                'category': resource.category,
-                'total_quantity': resource.total_quantity,
-                'available_quantity': resource.available_quantity,
-                'unit': resource.unit,
-                'description': resource.description,
-                'location': resource.location,
-                'expiry_date': resource.expiry_date.isoformat() if resource.expiry_date else None,
-                'min_threshold': resource.min_threshold,
-                'is_active': resource.is_active,
-                'created_at': resource.created_at.isoformat() if resource.created_at else None,
-                'updated_at': resource.updated_at.isoformat() if resource.updated_at else None
-            })
+        resources_data = [serialize(row) for row in resources.items]
         
         return jsonify({
             'resources': resources_data,
@@ -74,8 +91,7 @@ def get_resources():
 @jwt_required()
 def create_resource():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -96,22 +112,37 @@ def create_resource():
         if data['resource_type'] not in ['bed', 'medicine', 'equipment']:
             return jsonify({'error': 'Invalid resource type. Must be bed, medicine, or equipment'}), 400
         
+        quantities = {}
+        for field, value in (('total_quantity', data['total_quantity']),
+                             ('available_quantity', data.get('available_quantity', data['total_quantity'])),
+                             ('min_threshold', data['min_threshold'])):
+            try:
+                quantities[field] = int(value)
+            except (TypeError, ValueError):
+                return jsonify({'error': f'{field} must be an integer'}), 400
+        
+        if quantities['available_quantity'] < 0 or quantities['available_quantity'] > quantities['total_quantity']:
+            return jsonify({'error': 'available_quantity must be between 0 and total_quantity'}), 400
+        
         # Create resource
         resource = Resource(
             name=data['name'],
             resource_type=data['resource_type'],
             category=data.get('category', ''),
-            total_quantity=data['total_quantity'],
-            available_quantity=data.get('available_quantity', data['total_quantity']),
+            total_quantity=quantities['total_quantity'],
+            available_quantity=quantities['available_quantity'],
             unit=data.get('unit', ''),
             description=data.get('description', ''),
             location=data.get('location', ''),
             expiry_date=datetime.strptime(data['expiry_date'], '%Y-%m-%d').date() if data.get('expiry_date') else None,
-            min_threshold=data['min_threshold'],
+            min_threshold=quantities['min_threshold'],
             is_active=data.get('is_active', True)
         )
         
         db.session.add(resource)
+        counters.apply(counters.resource_deltas(None, counters.resource_snapshot(resource)))
+        notifications.stock_changed(resource, None)
+        versions.bump(versions.RESOURCES)
         db.session.commit()
         
         return jsonify({
@@ -123,12 +154,65 @@ def create_resource():
         db.session.rollback()
         return jsonify({'error': 'An error occurred while creating resource'}), 500
 
+@resources_bp.route('/<int:resource_id>', methods=['PUT'])
+@jwt_required()
+def update_resource(resource_id):
+    try:
+        user = load_current_user()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        # Only admin can update resources
+        if user.role != 'admin':
+            return jsonify({'error': 'Access denied. Admin role required'}), 403
+        
+        resource = Resource.query.get(resource_id)
+        if not resource:
+            return jsonify({'error': 'Resource not found'}), 404
+        
+        data = request.get_json() or {}
+        before = counters.resource_snapshot(resource)
+        
+        for field in ['name', 'category', 'unit', 'description', 'location', 'is_active']:
+            if field in data:
+                setattr(resource, field, data[field])
+        
+        for field in ['total_quantity', 'available_quantity', 'min_threshold']:
+            if field in data:
+                try:
+                    setattr(resource, field, int(data[field]))
+                except (TypeError, ValueError):
+                    return jsonify({'error': f'{field} must be an integer'}), 400
+        
+        if 'expiry_date' in data:
+            try:
+                resource.expiry_date = datetime.strptime(data['expiry_date'], '%Y-%m-%d').date() if data['expiry_date'] else None
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        if resource.available_quantity < 0 or resource.available_quantity > resource.total_quantity:
+            return jsonify({'error': 'available_quantity must be between 0 and total_quantity'}), 400
+        
+        counters.apply(counters.resource_deltas(before, counters.resource_snapshot(resource)))
+        notifications.stock_changed(resource, before)
+        versions.bump(versions.RESOURCES)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Resource updated successfully',
+            'data': resource.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'An error occurred while updating resource'}), 500
+
 @resources_bp.route('/alerts', methods=['GET'])
 @jwt_required()
 def get_resource_alerts():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
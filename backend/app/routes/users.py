@@ -1,17 +1,21 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.user import User
+from flask_jwt_extended import jwt_required
+from app.models.user import User, user_serializer
 from app import db
-from werkzeug.security import generate_password_hash
+from app.utils.pagination import keyset_paginate, approximate_total, MAX_PER_PAGE
+from app.utils.auth import load_current_user, invalidate_user
+from app.utils.conditional import conditional, admin_only
+from app.services import versions
+from app.services.directory import doctor_directory
 
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/', methods=['GET'])
 @jwt_required()
+@conditional(admin_only(versions.USERS))
 def get_users():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = load_current_user()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -26,6 +30,9 @@ def get_users():
         role = request.args.get('role')
         search = request.args.get('search')
         
+        if not 1 <= per_page <= MAX_PER_PAGE:
+            return jsonify({'error': f'per_page must be between 1 and {MAX_PER_PAGE}'}), 400
+        
         # Build query
         query = User.query
         
@@ -40,6 +47,33 @@ def get_users():
                 User.email.like(search_term)
             )
         
+        # ?fields=id,email,... loads and returns only those columns
+        try:
+            fields = user_serializer.select(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        serialize = user_serializer.extractor(fields)
+        query = query.with_entities(*user_serializer.columns(fields))
+        
+        # Opt-in keyset pagination: ?cursor= (empty for the first page) skips
+        # the COUNT and OFFSET, so every page costs the same
+        if 'cursor' in request.args:
+            try:
+                items, next_cursor = keyset_paginate(
+                    query, (User.id,), request.args.get('cursor'), per_page
+                )
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            
+            response = {
+                'users': [serialize(item) for item in items],
+                'next_cursor': next_cursor,
+                'per_page': per_page
+            }
+            if request.args.get('include_total') in ('1', 'true'):
+                response['total'] = approximate_total(('users', role, search), query)
+            return jsonify(response), 200
+        
         # Get users with pagination
         users = query.paginate(
             page=page, 
@@ -48,26 +82,7 @@ def get_users():
         )
         
         # Format response
-        users_data = []
-        for user in users.items:
-            users_data.append({
-                'id': user.id,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'role': user.role,
-                'is_active': user.is_active,
-                'phone': user.phone,
-                'specialty': user.specialty,
-                'license_number': user.license_number,
-                'experience_years': user.experience_years,
-                'date_of_birth': user.date_of_birth.isoformat() if user.date_of_birth else None,
-                'gender': user.gender,
-                'address': user.address,
-                'emergency_contact': user.emergency_contact,
-                'created_at': user.created_at.isoformat() if user.created_at else None,
-                'updated_at': user.updated_at.isoformat() if user.updated_at else None
-            })
+        users_data = [serialize(row) for row in users.items]
         
         return jsonify({
             'users': users_data,
@@ -84,40 +99,20 @@ def get_users():
 @jwt_required()
 def get_user(user_id):
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = load_current_user()
         
         if not current_user:
             return jsonify({'error': 'User not found'}), 404
         
         # Users can only view their own profile, admin can view any
-        if current_user.role != 'admin' and current_user_id != user_id:
+        if current_user.role != 'admin' and current_user.id != user_id:
             return jsonify({'error': 'Access denied'}), 403
         
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({
-            'data': {
-                'id': user.id,
-                'email': user.email,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'role': user.role,
-                'is_active': user.is_active,
-                'phone': user.phone,
-                'specialty': user.specialty,
-                'license_number': user.license_number,
-                'experience_years': user.experience_years,
-                'date_of_birth': user.date_of_birth.isoformat() if user.date_of_birth else None,
-                'gender': user.gender,
-                'address': user.address,
-                'emergency_contact': user.emergency_contact,
-                'created_at': user.created_at.isoformat() if user.created_at else None,
-                'updated_at': user.updated_at.isoformat() if user.updated_at else None
-            }
-        }), 200
+        return jsonify({'data': user.to_dict()}), 200
         
     except Exception as e:
         return jsonify({'error': 'An error occurred while fetching user'}), 500
@@ -126,8 +121,7 @@ def get_user(user_id):
 @jwt_required()
 def activate_user(user_id):
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = load_current_user()
         
         if not current_user or current_user.role != 'admin':
             return jsonify({'error': 'Access denied. Admin role required'}), 403
@@ -137,7 +131,12 @@ def activate_user(user_id):
             return jsonify({'error': 'User not found'}), 404
         
         user.is_active = True
+        user.auth_version = User.auth_version + 1
+        versions.bump(versions.USERS, *([versions.DOCTORS] if user.role == 'doctor' else []))
         db.session.commit()
+        invalidate_user(user.id)
+        if user.role == 'doctor':
+            doctor_directory.invalidate()
         
         return jsonify({'message': 'User activated successfully'}), 200
         
@@ -149,8 +148,7 @@ def activate_user(user_id):
 @jwt_required()
 def deactivate_user(user_id):
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = load_current_user()
         
         if not current_user or current_user.role != 'admin':
             return jsonify({'error': 'Access denied. Admin role required'}), 403
@@ -160,7 +158,12 @@ def deactivate_user(user_id):
             return jsonify({'error': 'User not found'}), 404
         
         user.is_active = False
+        user.auth_version = User.auth_version + 1
+        versions.bump(versions.USERS, *([versions.DOCTORS] if user.role == 'doctor' else []))
         db.session.commit()
+        invalidate_user(user.id)
+        if user.role == 'doctor':
+            doctor_directory.invalidate()
         
         return jsonify({'message': 'User deactivated successfully'}), 200
         
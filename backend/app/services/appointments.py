@@ -0,0 +1,74 @@
+from sqlalchemy.orm import aliased
+from app.models.appointment import Appointment, appointment_serializer
+from app.models.user import User
+from app.utils.serializers import ModelSerializer, Field
+
+# Two aliases of the users table so patient and doctor names can be joined
+# onto the same appointment row
+Patient = aliased(User, name='patient_user')
+Doctor = aliased(User, name='doctor_user')
+
+# Total order used by keyset pagination of appointment lists
+APPOINTMENT_SORT_KEY = (Appointment.appointment_date, Appointment.appointment_time, Appointment.id)
+
+def scope_appointments(query, user):
+    """Restrict an appointment query to the rows the given user may see"""
+    if user.role == 'patient':
+        return query.filter(Appointment.patient_id == user.id)
+    if user.role == 'doctor':
+        return query.filter(Appointment.doctor_id == user.id)
+    # Admin can see all appointments
+    return query
+
+def with_participant_names(query):
+    """Add patient and doctor names to an appointment query with one aliased join.
+
+    Each result row is ``(Appointment, patient_first_name, patient_last_name,
+    doctor_first_name, doctor_last_name)`` so callers never need a per-row
+    ``User.query.get``.
+    """
+    return query.outerjoin(
+        Patient, Patient.id == Appointment.patient_id
+    ).outerjoin(
+        Doctor, Doctor.id == Appointment.doctor_id
+    ).add_columns(
+        Patient.first_name.label('patient_first_name'),
+        Patient.last_name.label('patient_last_name'),
+        Doctor.first_name.label('doctor_first_name'),
+        Doctor.last_name.label('doctor_last_name')
+    )
+
+def full_name(first_name, last_name):
+    """Format a joined user name, falling back when the user row is missing"""
+    if first_name is None and last_name is None:
+        return "Unknown"
+    return f"{first_name} {last_name}"
+
+# Patient and doctor names, labelled so they read the same on every row
+_NAME_COLUMNS = {
+    'patient_name': (Patient.first_name.label('patient_first_name'), Patient.last_name.label('patient_last_name')),
+    'doctor_name': (Doctor.first_name.label('doctor_first_name'), Doctor.last_name.label('doctor_last_name'))
+}
+
+# Appointment list rows; the sort key is always loaded so keyset cursors work
+appointment_list_serializer = ModelSerializer(
+    [(name, field) for name, field in appointment_serializer.fields.items() if field.columns] + [
+        (name, Field(columns, f'full_name(row.{columns[0].key}, row.{columns[1].key})'))
+        for name, columns in _NAME_COLUMNS.items()
+    ],
+    required=('id', 'appointment_date', 'appointment_time'),
+    helpers={'full_name': full_name}
+)
+
+def project_appointments(query, names):
+    """Load only the columns behind ``names``, joining users only for the name fields.
+
+    Rows are flat, so they serialize with
+    ``appointment_list_serializer.extractor(names)`` and paginate by
+    ``APPOINTMENT_SORT_KEY`` directly.
+    """
+    if 'patient_name' in names:
+        query = query.outerjoin(Patient, Patient.id == Appointment.patient_id)
+    if 'doctor_name' in names:
+        query = query.outerjoin(Doctor, Doctor.id == Appointment.doctor_id)
+    return query.with_entities(*appointment_list_serializer.columns(names))
@@ -0,0 +1,258 @@
+import threading
+import time as clock
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from app.models.appointment import Appointment, SlotHold
+from app.services.intervals import IntervalIndex, to_minutes
+from app.utils.metrics import cache_stats
+
+# Bookable day: 9 AM to 5 PM in 30-minute slots, one bit per slot
+DAY_START_MINUTES = 9 * 60
+DAY_END_MINUTES = 17 * 60
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = (DAY_END_MINUTES - DAY_START_MINUTES) // SLOT_MINUTES
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+# Statuses that keep a slot occupied
+ACTIVE_STATUSES = ('scheduled', 'confirmed')
+
+SLOT_LABELS = tuple(
+    f"{(DAY_START_MINUTES + i * SLOT_MINUTES) // 60:02d}:{(DAY_START_MINUTES + i * SLOT_MINUTES) % 60:02d}"
+    for i in range(SLOTS_PER_DAY)
+)
+
+def slot_mask(start_minutes, end_minutes):
+    """Return the bits of the day's slots touched by ``[start, end)`` in minutes"""
+    start = start_minutes - DAY_START_MINUTES
+    end = end_minutes - DAY_START_MINUTES
+    first = max(start // SLOT_MINUTES, 0)
+    last = min(-(-end // SLOT_MINUTES), SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+def occupancy_bitmap(intervals):
+    bitmap = 0
+    for start, end in intervals:
+        bitmap |= slot_mask(start, end)
+    return bitmap
+
+class DaySchedule:
+    """Booked intervals for one doctor on one day, their slot bitmap and active holds.
+
+    ``holds`` is a list of ``(expires_at, start, end)``; a hold stops occupying
+    its slots as soon as it expires, without the entry being reloaded.
+    """
+
+    __slots__ = ('intervals', 'booked', 'holds', 'loaded_at')
+
+    def __init__(self, intervals, holds, loaded_at):
+        self.intervals = intervals
+        self.booked = occupancy_bitmap(intervals)
+        self.holds = holds
+        self.loaded_at = loaded_at
+
+    def occupancy(self, now):
+        bitmap = self.booked
+        for expires_at, start, end in self.holds:
+            if expires_at > now:
+                bitmap |= slot_mask(start, end)
+        return bitmap
+
+def start_mask(occupied, slots_needed):
+    """Bits of the slots where ``slots_needed`` consecutive free slots begin"""
+    free = ~occupied & FULL_DAY
+    starts = free
+    for shift in range(1, slots_needed):
+        starts &= free >> shift
+    return starts
+
+def slots_for(duration_minutes):
+    return max(-(-duration_minutes // SLOT_MINUTES), 1)
+
+@lru_cache(maxsize=4096)
+def free_slot_labels(occupied, slots_needed=1):
+    """Labels of the slots where a booking of ``slots_needed`` slots fits"""
+    starts = start_mask(occupied, slots_needed)
+    return tuple(label for i, label in enumerate(SLOT_LABELS) if starts >> i & 1)
+
+class AvailabilityEngine:
+    """Per-process cache of doctor day schedules keyed by (doctor_id, date).
+
+    Each entry holds the day's interval index and the occupancy bitmap derived
+    from it. Entries are updated or dropped on writes in this process and
+    expire after ``ttl`` seconds so writes made by other workers become visible.
+    """
+
+    def __init__(self, max_entries=20000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = cache_stats('availability')
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None or now - entry.loaded_at > self.ttl:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, doctor_ids, days, now):
+        """Load the day schedules for every (doctor, day) pair with one query per table"""
+        booked = {(doctor_id, day): [] for doctor_id in doctor_ids for day in days}
+        held = {key: [] for key in booked}
+        rows = Appointment.query.with_entities(
+            Appointment.doctor_id,
+            Appointment.appointment_date,
+            Appointment.appointment_time,
+            Appointment.duration_minutes
+        ).filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.appointment_date >= days[0],
+            Appointment.appointment_date <= days[-1],
+            Appointment.status.in_(ACTIVE_STATUSES)
+        ).all()
+        for doctor_id, appointment_date, appointment_time, duration_minutes in rows:
+            intervals = booked.get((doctor_id, appointment_date))
+            if intervals is not None:
+                start = to_minutes(appointment_time)
+                intervals.append((start, start + (duration_minutes or SLOT_MINUTES)))
+
+        holds = SlotHold.query.with_entities(
+            SlotHold.doctor_id,
+            SlotHold.appointment_date,
+            SlotHold.appointment_time,
+            SlotHold.duration_minutes,
+            SlotHold.expires_at
+        ).filter(
+            SlotHold.doctor_id.in_(doctor_ids),
+            SlotHold.appointment_date >= days[0],
+            SlotHold.appointment_date <= days[-1],
+            SlotHold.expires_at > datetime.utcnow()
+        ).all()
+        for doctor_id, appointment_date, appointment_time, duration_minutes, expires_at in holds:
+            day_holds = held.get((doctor_id, appointment_date))
+            if day_holds is not None:
+                start = to_minutes(appointment_time)
+                day_holds.append((expires_at, start, start + (duration_minutes or SLOT_MINUTES)))
+
+        return {
+            key: DaySchedule(IntervalIndex(intervals), held[key], now)
+            for key, intervals in booked.items()
+        }
+
+    def schedules(self, doctor_ids, start_date, end_date):
+        """Return ``{(doctor_id, date): DaySchedule}`` for the given doctors and days.
+
+        Every pair missing from the cache is loaded in a single query.
+        """
+        now = clock.monotonic()
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        result = {}
+        missing_doctors = set()
+        missing_days = set()
+        with self._lock:
+            for doctor_id in doctor_ids:
+                for day in days:
+                    entry = self._get((doctor_id, day), now)
+                    if entry is None:
+                        missing_doctors.add(doctor_id)
+                        missing_days.add(day)
+                    else:
+                        result[(doctor_id, day)] = entry
+
+        if missing_doctors:
+            loaded = self._load(sorted(missing_doctors), sorted(missing_days), now)
+            with self._lock:
+                for key, entry in loaded.items():
+                    if key not in result:
+                        self._put(key, entry)
+                        result[key] = entry
+
+        return result
+
+    def occupancy_bulk(self, doctor_ids, start_date, end_date):
+        """Return ``{(doctor_id, date): bitmap}`` for the given doctors and days"""
+        now = datetime.utcnow()
+        return {key: entry.occupancy(now) for key, entry in self.schedules(doctor_ids, start_date, end_date).items()}
+
+    def occupancy_range(self, doctor_id, start_date, end_date):
+        """Return ``{date: bitmap}`` for every day in ``[start_date, end_date]``"""
+        bitmaps = self.occupancy_bulk((doctor_id,), start_date, end_date)
+        return {day: bitmap for (_, day), bitmap in bitmaps.items()}
+
+    def occupancy(self, doctor_id, day):
+        return self.occupancy_range(doctor_id, day, day)[day]
+
+    def free_slots(self, doctor_id, day, duration_minutes=SLOT_MINUTES):
+        return list(free_slot_labels(self.occupancy(doctor_id, day), slots_for(duration_minutes)))
+
+    def free_slots_range(self, doctor_id, start_date, end_date, duration_minutes=SLOT_MINUTES):
+        slots_needed = slots_for(duration_minutes)
+        bitmaps = self.occupancy_range(doctor_id, start_date, end_date)
+        return {day: list(free_slot_labels(bitmap, slots_needed)) for day, bitmap in bitmaps.items()}
+
+    def earliest_slots(self, doctor_ids, start_date, end_date, duration_minutes, limit, not_before=None):
+        """Find the ``limit`` earliest starts across doctors with room for the duration.
+
+        Returns ``(date, slot_index, doctor_id)`` tuples in chronological order.
+        Ties within a slot are broken by doctor id.
+        ``not_before`` is a ``(date, slot_index)`` pair; earlier starts are skipped.
+        """
+        slots_needed = slots_for(duration_minutes)
+        if slots_needed > SLOTS_PER_DAY or not doctor_ids:
+            return []
+
+        found = []
+        bitmaps = {}
+        loaded_until = start_date - timedelta(days=1)
+        chunk_days = 1
+        day = start_date
+        while day <= end_date and len(found) < limit:
+            # Load the window in doubling chunks so the common case, an opening
+            # in the first few days, never reads the whole window
+            if day > loaded_until:
+                loaded_until = min(day + timedelta(days=chunk_days - 1), end_date)
+                bitmaps = self.occupancy_bulk(doctor_ids, day, loaded_until)
+                chunk_days *= 2
+            skip = 0
+            if not_before and day == not_before[0]:
+                skip = not_before[1]
+            elif not_before and day < not_before[0]:
+                skip = SLOTS_PER_DAY
+            day_found = []
+            for doctor_id in doctor_ids:
+                starts = start_mask(bitmaps[(doctor_id, day)], slots_needed) >> skip << skip
+                while starts:
+                    low = starts & -starts
+                    day_found.append((day, low.bit_length() - 1, doctor_id))
+                    starts ^= low
+            day_found.sort()
+            found.extend(day_found[:limit - len(found)])
+            day += timedelta(days=1)
+        return found
+
+    def prime(self, doctor_id, day, intervals, holds):
+        """Cache a day's bookings and holds that the caller just read under lock"""
+        with self._lock:
+            self._put((doctor_id, day), DaySchedule(intervals, holds, clock.monotonic()))
+
+    def invalidate(self, doctor_id, day):
+        with self._lock:
+            self._entries.pop((doctor_id, day), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+availability = AvailabilityEngine()
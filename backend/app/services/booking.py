@@ -0,0 +1,340 @@
+import heapq
+import threading
+import time as clock
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models.appointment import Appointment, SlotHold
+from app.models.user import User
+from app.services import counters, notifications, versions
+from app.services.availability import availability, ACTIVE_STATUSES, SLOT_MINUTES
+from app.services.intervals import IntervalIndex, to_minutes
+
+# Seconds a booker waits for another booking of the same doctor-day to finish
+LOCK_TIMEOUT = 2
+
+# Default lifetime of a slot hold, overridable with SLOT_HOLD_TTL_SECONDS
+HOLD_TTL_SECONDS = 300
+
+# Expired holds left by other workers are swept at least this often
+REAP_INTERVAL_SECONDS = 60
+
+# Most occurrences a single recurring series may create
+MAX_SERIES_OCCURRENCES = 52
+
+RECURRENCE_STEPS = {'daily': 1, 'weekly': 7}
+
+# Striped in-process locks so threads of one worker queue up without
+# touching the database; row locks below serialize across workers
+_LOCK_STRIPES = [threading.Lock() for _ in range(256)]
+
+# Expiry times of holds placed by this worker, soonest first, so the reaper
+# only issues a DELETE when something has actually expired
+_hold_expiries = []
+_reap_lock = threading.Lock()
+_last_reap = 0.0
+
+class SlotConflict(Exception):
+    """The requested interval overlaps an active appointment or hold"""
+
+class BookingBusy(Exception):
+    """The doctor-day is locked by another booking for too long"""
+
+class HoldNotFound(Exception):
+    """The hold does not exist, has expired or belongs to someone else"""
+
+@contextmanager
+def doctor_days_lock(doctor_id, days, timeout=LOCK_TIMEOUT):
+    # Stripes are taken in index order so overlapping multi-day lockers
+    # cannot deadlock each other
+    stripes = sorted({hash((doctor_id, day)) % len(_LOCK_STRIPES) for day in days})
+    deadline = clock.monotonic() + timeout
+    acquired = []
+    try:
+        for stripe in stripes:
+            lock = _LOCK_STRIPES[stripe]
+            if not lock.acquire(timeout=max(deadline - clock.monotonic(), 0)):
+                raise BookingBusy()
+            acquired.append(lock)
+        yield
+    finally:
+        for lock in reversed(acquired):
+            lock.release()
+
+def doctor_day_lock(doctor_id, day, timeout=LOCK_TIMEOUT):
+    return doctor_days_lock(doctor_id, (day,), timeout)
+
+def _lock_day(doctor_id, day, now):
+    """Lock the doctor row and re-read the day's bookings and live holds"""
+    db.session.query(User.id).filter(User.id == doctor_id).with_for_update().one()
+    booked = db.session.query(
+        Appointment.appointment_time,
+        Appointment.duration_minutes
+    ).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date == day,
+        Appointment.status.in_(ACTIVE_STATUSES)
+    ).with_for_update().all()
+    holds = SlotHold.query.filter(
+        SlotHold.doctor_id == doctor_id,
+        SlotHold.appointment_date == day,
+        SlotHold.expires_at > now
+    ).with_for_update().all()
+
+    intervals = IntervalIndex(
+        (to_minutes(booked_time), to_minutes(booked_time) + (duration or SLOT_MINUTES))
+        for booked_time, duration in booked
+    )
+    return intervals, holds
+
+def _hold_interval(hold):
+    start = to_minutes(hold.appointment_time)
+    return start, start + (hold.duration_minutes or SLOT_MINUTES)
+
+def _cached_holds(holds):
+    return [(hold.expires_at,) + _hold_interval(hold) for hold in holds]
+
+def _overlaps_hold(holds, start, end):
+    return any(hold_start < end and start < hold_end for hold_start, hold_end in map(_hold_interval, holds))
+
+def book_appointment(hold_id=None, holder_id=None, **fields):
+    """Insert an appointment if its interval is free, serialized per doctor-day.
+
+    The doctor's user row is locked with ``SELECT ... FOR UPDATE`` and the
+    day's bookings are re-read with a locking read, so two workers can never
+    both see the interval as free. Live holds block the interval too, except
+    ``hold_id`` when it was placed by ``holder_id``, which is consumed. Raises
+    ``SlotConflict`` when the interval is taken and ``BookingBusy`` when the
+    lock cannot be obtained in time.
+    """
+    doctor_id = fields['doctor_id']
+    day = fields['appointment_date']
+    start = to_minutes(fields['appointment_time'])
+    end = start + (fields.get('duration_minutes') or SLOT_MINUTES)
+    now = datetime.utcnow()
+
+    with doctor_day_lock(doctor_id, day):
+        try:
+            intervals, holds = _lock_day(doctor_id, day, now)
+            own_holds = [hold for hold in holds if hold.id == hold_id and hold.user_id == holder_id]
+            other_holds = [hold for hold in holds if hold not in own_holds]
+            if intervals.overlaps(start, end) or _overlaps_hold(other_holds, start, end):
+                db.session.rollback()
+                raise SlotConflict()
+
+            appointment = Appointment(**fields)
+            db.session.add(appointment)
+            for hold in own_holds:
+                db.session.delete(hold)
+            counters.apply(counters.appointment_deltas(
+                doctor_id, fields['patient_id'], None, fields['status']
+            ))
+            notifications.appointment_booked(doctor_id, fields['patient_id'], day, fields['appointment_time'])
+            versions.bump(*versions.appointment_stamps(doctor_id, fields['patient_id']))
+            db.session.commit()
+        except OperationalError:
+            # Lock wait timeout or deadlock in the database
+            db.session.rollback()
+            raise BookingBusy()
+
+        intervals.add(start, end)
+        availability.prime(doctor_id, day, intervals, _cached_holds(other_holds))
+
+    return appointment
+
+@contextmanager
+def reclaim_interval(appointment):
+    """Hold ``appointment``'s doctor-day while it becomes active again.
+
+    Runs the same locked overlap check as ``book_appointment``: a cancelled
+    appointment's slot may have been booked or held since. Raises
+    ``SlotConflict`` or ``BookingBusy`` like it; the caller updates the
+    appointment and commits inside the block.
+    """
+    doctor_id = appointment.doctor_id
+    day = appointment.appointment_date
+    start = to_minutes(appointment.appointment_time)
+    end = start + (appointment.duration_minutes or SLOT_MINUTES)
+
+    with doctor_day_lock(doctor_id, day):
+        try:
+            intervals, holds = _lock_day(doctor_id, day, datetime.utcnow())
+            if intervals.overlaps(start, end) or _overlaps_hold(holds, start, end):
+                db.session.rollback()
+                raise SlotConflict()
+            yield
+        except OperationalError:
+            db.session.rollback()
+            raise BookingBusy()
+
+        intervals.add(start, end)
+        availability.prime(doctor_id, day, intervals, _cached_holds(holds))
+
+def expand_recurrence(start_date, frequency, interval=1, count=None, until=None):
+    """Dates of a daily or weekly series starting at ``start_date``.
+
+    The series ends after ``count`` occurrences or on ``until``, whichever
+    comes first, and never exceeds ``MAX_SERIES_OCCURRENCES``.
+    """
+    if frequency not in RECURRENCE_STEPS:
+        raise ValueError('frequency must be daily or weekly')
+    if interval < 1 or (count is not None and count < 1) or (count is None and until is None):
+        raise ValueError('a positive interval and either count or until are required')
+
+    limit = min(count or MAX_SERIES_OCCURRENCES, MAX_SERIES_OCCURRENCES)
+    step = timedelta(days=RECURRENCE_STEPS[frequency] * interval)
+    dates = []
+    day = start_date
+    while len(dates) < limit and (until is None or day <= until):
+        dates.append(day)
+        day += step
+    return dates
+
+def book_series(dates, hold_id=None, holder_id=None, **fields):
+    """Book the same slot on every date in one transaction.
+
+    Bookings and holds for the whole series are read with one range query
+    each, occurrences that collide are skipped and the rest are written with
+    a single bulk insert. Returns ``(booked_dates, conflicting_dates)``.
+    """
+    doctor_id = fields['doctor_id']
+    start = to_minutes(fields['appointment_time'])
+    end = start + (fields.get('duration_minutes') or SLOT_MINUTES)
+    now = datetime.utcnow()
+    wanted = set(dates)
+
+    with doctor_days_lock(doctor_id, dates):
+        try:
+            db.session.query(User.id).filter(User.id == doctor_id).with_for_update().one()
+            booked = db.session.query(
+                Appointment.appointment_date,
+                Appointment.appointment_time,
+                Appointment.duration_minutes
+            ).filter(
+                Appointment.doctor_id == doctor_id,
+                Appointment.appointment_date >= dates[0],
+                Appointment.appointment_date <= dates[-1],
+                Appointment.status.in_(ACTIVE_STATUSES)
+            ).with_for_update().all()
+            holds = SlotHold.query.filter(
+                SlotHold.doctor_id == doctor_id,
+                SlotHold.appointment_date >= dates[0],
+                SlotHold.appointment_date <= dates[-1],
+                SlotHold.expires_at > now
+            ).with_for_update().all()
+
+            taken = {}
+            for booked_date, booked_time, duration in booked:
+                if booked_date in wanted:
+                    booked_start = to_minutes(booked_time)
+                    taken.setdefault(booked_date, IntervalIndex()).add(booked_start, booked_start + (duration or SLOT_MINUTES))
+            own_holds = [hold for hold in holds if hold.id == hold_id and hold.user_id == holder_id]
+            for hold in holds:
+                if hold not in own_holds and hold.appointment_date in wanted:
+                    taken.setdefault(hold.appointment_date, IntervalIndex()).add(*_hold_interval(hold))
+
+            booked_dates = []
+            conflicting_dates = []
+            for day in dates:
+                if day in taken and taken[day].overlaps(start, end):
+                    conflicting_dates.append(day)
+                else:
+                    booked_dates.append(day)
+
+            if booked_dates:
+                timestamp = datetime.utcnow()
+                db.session.execute(insert(Appointment), [
+                    dict(fields, appointment_date=day, created_at=timestamp, updated_at=timestamp)
+                    for day in booked_dates
+                ])
+                counters.apply(counters.appointment_deltas(
+                    doctor_id, fields['patient_id'], None, fields['status'], count=len(booked_dates)
+                ))
+                notifications.appointment_booked(
+                    doctor_id, fields['patient_id'], booked_dates[0], fields['appointment_time'], count=len(booked_dates)
+                )
+                versions.bump(*versions.appointment_stamps(doctor_id, fields['patient_id']))
+            for hold in own_holds:
+                db.session.delete(hold)
+            db.session.commit()
+        except OperationalError:
+            db.session.rollback()
+            raise BookingBusy()
+
+        for day in booked_dates:
+            availability.invalidate(doctor_id, day)
+
+    return booked_dates, conflicting_dates
+
+def place_hold(user_id, doctor_id, day, appointment_time, duration_minutes):
+    """Reserve an interval for a short TTL while the user completes a booking.
+
+    A user keeps at most one hold; placing a new one releases the previous.
+    """
+    reap_expired_holds()
+    ttl = current_app.config.get('SLOT_HOLD_TTL_SECONDS', HOLD_TTL_SECONDS)
+    start = to_minutes(appointment_time)
+    end = start + duration_minutes
+    now = datetime.utcnow()
+
+    for previous in SlotHold.query.filter_by(user_id=user_id).all():
+        release_hold(user_id, previous.id)
+
+    with doctor_day_lock(doctor_id, day):
+        try:
+            intervals, holds = _lock_day(doctor_id, day, now)
+            if intervals.overlaps(start, end) or _overlaps_hold(holds, start, end):
+                db.session.rollback()
+                raise SlotConflict()
+
+            hold = SlotHold(
+                doctor_id=doctor_id,
+                user_id=user_id,
+                appointment_date=day,
+                appointment_time=appointment_time,
+                duration_minutes=duration_minutes,
+                expires_at=now + timedelta(seconds=ttl)
+            )
+            db.session.add(hold)
+            db.session.commit()
+        except OperationalError:
+            db.session.rollback()
+            raise BookingBusy()
+
+        holds.append(hold)
+        availability.prime(doctor_id, day, intervals, _cached_holds(holds))
+
+    with _reap_lock:
+        heapq.heappush(_hold_expiries, hold.expires_at)
+    return hold
+
+def release_hold(user_id, hold_id):
+    hold = SlotHold.query.filter_by(id=hold_id, user_id=user_id).first()
+    if not hold:
+        raise HoldNotFound()
+    db.session.delete(hold)
+    db.session.commit()
+    availability.invalidate(hold.doctor_id, hold.appointment_date)
+
+def reap_expired_holds():
+    """Delete expired holds with a range delete on the ``expires_at`` index.
+
+    Runs only when a hold placed by this worker has expired or the periodic
+    interval has passed, so most calls cost a heap peek.
+    """
+    global _last_reap
+    now = datetime.utcnow()
+    with _reap_lock:
+        due = bool(_hold_expiries) and _hold_expiries[0] <= now
+        if not due and clock.monotonic() - _last_reap < REAP_INTERVAL_SECONDS:
+            return 0
+        while _hold_expiries and _hold_expiries[0] <= now:
+            heapq.heappop(_hold_expiries)
+        _last_reap = clock.monotonic()
+
+    deleted = SlotHold.query.filter(SlotHold.expires_at <= now).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,201 @@
+from collections import Counter
+from datetime import date
+from sqlalchemy import func, insert, text, update
+from app import db
+from app.models.appointment import Appointment
+from app.models.dashboard import DashboardCounter
+from app.models.resource import Resource
+
+APPOINTMENT_STATUSES = ('scheduled', 'confirmed', 'cancelled', 'completed', 'no_show')
+
+# Appointment counts are kept per status for every scope a dashboard reads
+ALL_APPOINTMENTS = 'appointments'
+DOCTOR = 'doctor'
+PATIENT = 'patient'
+RESOURCES = 'resources'
+
+# Written by ``rebuild`` so readers know the table has been populated
+_INITIALIZED = ('meta', 0, 'initialized')
+
+# The hospital-wide counts are split over this many rows per status, picked
+# by doctor, so bookings for different doctors rarely wait on the same row;
+# admins read them all with one primary key prefix lookup
+APPOINTMENT_SHARDS = 8
+
+def appointment_shard(doctor_id):
+    return int(doctor_id) % APPOINTMENT_SHARDS
+
+def appointment_deltas(doctor_id, patient_id, old_status, new_status, count=1):
+    """Counter changes for appointments moving from ``old_status`` to ``new_status``.
+
+    Use ``old_status=None`` for new appointments.
+    """
+    deltas = Counter()
+    for scope, scope_id in ((ALL_APPOINTMENTS, appointment_shard(doctor_id)), (DOCTOR, doctor_id), (PATIENT, patient_id)):
+        if old_status:
+            deltas[(scope, int(scope_id), old_status)] -= count
+        if new_status:
+            deltas[(scope, int(scope_id), new_status)] += count
+    return deltas
+
+def _resource_contribution(resource_type, total_quantity, available_quantity, min_threshold):
+    contribution = Counter({'total': 1, resource_type: 1})
+    if available_quantity <= (min_threshold or 0):
+        contribution['low_stock'] = 1
+    if resource_type == 'bed':
+        contribution['bed_capacity'] = total_quantity
+        contribution['occupied_beds'] = total_quantity - available_quantity
+    return contribution
+
+def resource_snapshot(resource):
+    """The fields of a resource the counters depend on, taken before an update"""
+    return (resource.resource_type, resource.total_quantity, resource.available_quantity, resource.min_threshold)
+
+def resource_deltas(before, after):
+    """Counter changes for a resource going from snapshot ``before`` to ``after``"""
+    deltas = Counter()
+    if after:
+        for name, value in _resource_contribution(*after).items():
+            deltas[(RESOURCES, 0, name)] += value
+    if before:
+        for name, value in _resource_contribution(*before).items():
+            deltas[(RESOURCES, 0, name)] -= value
+    return deltas
+
+def _upsert(table, key_columns, value_column, rows, merge):
+    dialect = db.session.get_bind().dialect.name
+    column = table.c[value_column]
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        statement = mysql_insert(table)
+        statement = statement.on_duplicate_key_update(
+            {value_column: merge(dialect, column, statement.inserted[value_column])}
+        )
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert_insert
+        statement = upsert_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c[key] for key in key_columns],
+            set_={value_column: merge(dialect, column, statement.excluded[value_column])}
+        )
+    else:
+        for row in rows:
+            updated = db.session.execute(
+                update(table).where(*[table.c[key] == row[key] for key in key_columns]).values(
+                    {value_column: merge(dialect, column, row[value_column])}
+                )
+            ).rowcount
+            if not updated:
+                db.session.execute(insert(table), [row])
+        return
+    db.session.execute(statement, rows)
+
+def increment(table, key_columns, value_column, rows):
+    """Upsert ``rows`` into ``table``, adding ``value_column`` to the existing value on a key clash.
+
+    Uses a single statement where the dialect supports it; the caller commits.
+    """
+    _upsert(table, key_columns, value_column, rows, lambda dialect, current, new: current + new)
+
+def advance(table, key_columns, value_column, rows):
+    """Upsert ``rows`` into ``table``, keeping the larger of the existing and new ``value_column``.
+
+    Uses a single statement where the dialect supports it; the caller commits.
+    """
+    def larger(dialect, current, new):
+        # SQLite spells GREATEST as the two-argument max()
+        return func.max(current, new) if dialect == 'sqlite' else func.greatest(current, new)
+    _upsert(table, key_columns, value_column, rows, larger)
+
+def apply(deltas):
+    """Add ``{(scope, scope_id, name): delta}`` to the counters in the current transaction.
+
+    Uses a single upsert statement; the caller commits.
+    """
+    rows = [
+        {'scope': scope, 'scope_id': scope_id, 'name': name, 'value': delta}
+        for (scope, scope_id, name), delta in deltas.items() if delta
+    ]
+    if rows:
+        increment(DashboardCounter.__table__, ('scope', 'scope_id', 'name'), 'value', rows)
+
+def rebuild():
+    """Recompute every counter from the source tables and commit.
+
+    Writers are held off before the sources are read: on PostgreSQL by a
+    table lock, elsewhere by deleting every counter row, which keeps them
+    (and, under InnoDB's REPEATABLE READ, the gaps between them) locked
+    until the commit. A write committed before that is in the counts; one
+    still open waits and then applies its deltas on top. Run it in a fresh
+    transaction, so MySQL's snapshot is taken after the delete.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text('LOCK TABLE dashboard_counters IN SHARE ROW EXCLUSIVE MODE'))
+    db.session.query(DashboardCounter).delete(synchronize_session=False)
+
+    deltas = Counter()
+    rows = db.session.query(
+        Appointment.doctor_id, Appointment.patient_id, Appointment.status, func.count(Appointment.id)
+    ).group_by(Appointment.doctor_id, Appointment.patient_id, Appointment.status).all()
+    for doctor_id, patient_id, status, count in rows:
+        deltas.update(appointment_deltas(doctor_id, patient_id, None, status, count))
+
+    for snapshot in db.session.query(
+        Resource.resource_type, Resource.total_quantity, Resource.available_quantity, Resource.min_threshold
+    ):
+        deltas.update(resource_deltas(None, tuple(snapshot)))
+    deltas[_INITIALIZED] = 1
+    apply(deltas)
+    db.session.commit()
+
+def _read(scope, scope_id):
+    rows = db.session.query(DashboardCounter.name, DashboardCounter.value).filter(
+        DashboardCounter.scope == scope, DashboardCounter.scope_id == scope_id
+    ).all()
+    return {name: int(value) for name, value in rows}
+
+def _read_shards(scope, shards):
+    rows = db.session.query(DashboardCounter.name, DashboardCounter.value).filter(
+        DashboardCounter.scope == scope, DashboardCounter.scope_id.in_(range(shards))
+    ).all()
+    counts = Counter()
+    for name, value in rows:
+        counts[name] += int(value)
+    return counts
+
+def ensure_initialized():
+    """Build the counters once for a new database; reads never do, they only see zeros until then"""
+    if not db.session.get(DashboardCounter, _INITIALIZED):
+        rebuild()
+
+def appointment_counts(user):
+    """Per-status appointment counts visible to ``user``, read by primary key prefix"""
+    if user.role == 'patient':
+        counts = _read(PATIENT, user.id)
+    elif user.role == 'doctor':
+        counts = _read(DOCTOR, user.id)
+    else:
+        counts = _read_shards(ALL_APPOINTMENTS, APPOINTMENT_SHARDS)
+    return {status: counts.get(status, 0) for status in APPOINTMENT_STATUSES}
+
+def resource_counts():
+    """Resource counts, stock alerts and bed occupancy for the admin dashboard"""
+    counts = _read(RESOURCES, 0)
+    # Expiry depends on today's date, so it is counted on the (type, expiry) index
+    expired = db.session.query(func.count(Resource.id)).filter(
+        Resource.resource_type == 'medicine',
+        Resource.expiry_date < date.today()
+    ).scalar()
+    return {
+        'total_resources': counts.get('total', 0),
+        'total_beds': counts.get('bed', 0),
+        'total_medicines': counts.get('medicine', 0),
+        'total_equipment': counts.get('equipment', 0),
+        'low_stock_count': counts.get('low_stock', 0),
+        'expired_medicines': expired,
+        'bed_capacity': counts.get('bed_capacity', 0),
+        'occupied_beds': counts.get('occupied_beds', 0)
+    }
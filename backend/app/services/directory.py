@@ -0,0 +1,92 @@
+import threading
+import time
+from flask import current_app
+from app.models.user import User
+from app.services import versions
+from app.utils.metrics import cache_stats
+
+# Seconds between reads of the shared doctors stamp, overridable with
+# DOCTOR_DIRECTORY_CHECK_SECONDS; bounds how long a worker keeps serving the
+# directory after another worker changed a doctor
+VERSION_CHECK_SECONDS = 5
+
+class DirectorySnapshot:
+    """Active doctors at one version of the doctors stamp, indexed by specialty.
+
+    Never mutated once built, so readers use it without a lock.
+    """
+
+    __slots__ = ('version', 'doctors', 'by_id', 'by_specialty', 'specialties')
+
+    def __init__(self, version, doctors):
+        self.version = version
+        self.doctors = tuple(doctors)
+        self.by_id = {doctor['id']: doctor for doctor in self.doctors}
+        by_specialty = {}
+        names = {}
+        for doctor in self.doctors:
+            if doctor['specialty']:
+                key = doctor['specialty'].lower()
+                by_specialty.setdefault(key, []).append(doctor)
+                names.setdefault(key, doctor['specialty'])
+        self.by_specialty = {key: tuple(group) for key, group in by_specialty.items()}
+        self.specialties = tuple(sorted(names.values(), key=str.lower))
+
+class DoctorDirectory:
+    """Per-process copy of the active doctors, reloaded when the doctors stamp moves.
+
+    Every worker checks the stamp at most every ``VERSION_CHECK_SECONDS``
+    and reloads only when it changed; ``invalidate`` makes this worker check
+    on the next read after its own writes.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+        self.stats = cache_stats('doctor_directory')
+
+    def _load(self, version):
+        rows = User.query.with_entities(
+            User.id, User.first_name, User.last_name, User.specialty, User.experience_years
+        ).filter(User.role == 'doctor', User.is_active == True).order_by(User.id).all()
+        return DirectorySnapshot(version, [row._asdict() for row in rows])
+
+    def snapshot(self):
+        interval = current_app.config.get('DOCTOR_DIRECTORY_CHECK_SECONDS', VERSION_CHECK_SECONDS)
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < interval:
+            self.stats.hits += 1
+            return snapshot
+
+        # One thread reloads while the others wait for its snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now - self._checked_at < interval:
+                return snapshot
+            version = versions.current([versions.DOCTORS])[versions.DOCTORS]
+            if snapshot is None or snapshot.version != version:
+                self.stats.misses += 1
+                snapshot = self._snapshot = self._load(version)
+            else:
+                self.stats.hits += 1
+            self._checked_at = now
+        return snapshot
+
+    def invalidate(self):
+        """Re-check the stamp on the next read; call after committing a doctor change"""
+        self._checked_at = float('-inf')
+
+    def versions(self, names):
+        """``versions.current`` for the doctors stamp, answered from the snapshot"""
+        return {versions.DOCTORS: self.snapshot().version}
+
+    def doctors(self, specialty=None):
+        """Active doctors, optionally only those with ``specialty`` (case-insensitive)"""
+        snapshot = self.snapshot()
+        if specialty is None:
+            return snapshot.doctors
+        return snapshot.by_specialty.get(specialty.strip().lower(), ())
+
+doctor_directory = DoctorDirectory()
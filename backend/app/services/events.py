@@ -0,0 +1,177 @@
+"""In-process fan-out of new notification feed rows to streaming clients.
+
+Each worker runs one tailer that reads rows appended to the notifications
+table (by any worker) and hands them to the local subscribers of the row's
+user. Clients hold no thread of their own: a subscription is a small buffer
+and an event, and the stream generators block on that event. Under a
+cooperative worker (``gunicorn -k gevent``) thousands of idle streams cost
+a greenlet each.
+"""
+import threading
+import time
+from collections import deque
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+from app import db
+from app.models.notification import Notification
+
+# Seconds between feed reads when no local write has signalled new rows
+TAIL_INTERVAL = 1.0
+
+# Rows read from the feed per tailer pass
+TAIL_BATCH_SIZE = 500
+
+# Ids are assigned at insert, not at commit, so a row can appear below ids
+# already read. Gaps in the ids read are re-checked for this long, which must
+# outlast the slowest transaction that writes notifications
+TAIL_GAP_SECONDS = 30
+
+# Beyond this many open gaps they are re-checked as one id range
+TAIL_MAX_GAPS = 100
+
+# Undelivered events buffered per subscription before it falls back to a
+# replay from the feed table
+SUBSCRIPTION_BUFFER = 100
+
+class Subscription:
+    __slots__ = ('user_id', 'buffer', 'overflowed', 'ready')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.buffer = deque()
+        self.overflowed = False
+        self.ready = threading.Event()
+
+    def push(self, item):
+        if len(self.buffer) >= SUBSCRIPTION_BUFFER:
+            self.overflowed = True
+        else:
+            self.buffer.append(item)
+        self.ready.set()
+
+    def drain(self, timeout):
+        """Wait up to ``timeout`` seconds and return ``(items, overflowed)``"""
+        self.ready.wait(timeout)
+        self.ready.clear()
+        items = []
+        while self.buffer:
+            items.append(self.buffer.popleft())
+        overflowed, self.overflowed = self.overflowed, False
+        return items, overflowed
+
+class NotificationBroker:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._tailer = None
+        self._last_id = None
+        self._gaps = []
+        self._recent = {}
+
+    def subscribe(self, user_id, app):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            if self._tailer is None or not self._tailer.is_alive():
+                self._tailer = threading.Thread(target=self._tail, args=(app,), name='notification-tailer', daemon=True)
+                self._tailer.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def wake(self):
+        """Read the feed now instead of at the next interval"""
+        self._wake.set()
+
+    def publish(self, rows):
+        """Hand feed rows to the subscriptions of their users"""
+        with self._lock:
+            for row in rows:
+                for subscription in self._subscribers.get(row['user_id'], ()):
+                    subscription.push(row)
+
+    def _tail(self, app):
+        with app.app_context():
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        # New subscribers replay from the table themselves
+                        self._tailer = None
+                        self._last_id = None
+                        self._gaps = []
+                        self._recent = {}
+                        return
+                rows = []
+                try:
+                    if self._last_id is None:
+                        self._last_id = db.session.query(func.max(Notification.id)).scalar() or 0
+                    late = self._read_gaps()
+                    rows = Notification.query.filter(
+                        Notification.id > self._last_id
+                    ).order_by(Notification.id).limit(TAIL_BATCH_SIZE).all()
+                    self._note_gaps(rows)
+                    sent = late + rows
+                    if sent:
+                        now = time.monotonic()
+                        for row in sent:
+                            self._recent[row.id] = now
+                        self.publish([dict(row.to_dict(), user_id=row.user_id) for row in sent])
+                except Exception:
+                    app.logger.exception('Notification tailer failed to read the feed')
+                finally:
+                    db.session.remove()
+                if len(rows) < TAIL_BATCH_SIZE:
+                    self._wake.wait(TAIL_INTERVAL)
+                    self._wake.clear()
+
+    def _note_gaps(self, rows):
+        """Remember the ids skipped between the rows just read; they may still commit"""
+        now = time.monotonic()
+        expected = self._last_id + 1
+        for row in rows:
+            if row.id > expected:
+                self._gaps.append((expected, row.id - 1, now))
+            expected = row.id + 1
+        if rows:
+            self._last_id = rows[-1].id
+
+    def _read_gaps(self):
+        """Rows that committed inside a gap since it was noticed, each returned once"""
+        now = time.monotonic()
+        self._gaps = [gap for gap in self._gaps if now - gap[2] < TAIL_GAP_SECONDS]
+        self._recent = {row_id: sent_at for row_id, sent_at in self._recent.items() if now - sent_at < TAIL_GAP_SECONDS}
+        if not self._gaps:
+            return []
+        if len(self._gaps) > TAIL_MAX_GAPS:
+            self._gaps = [(min(gap[0] for gap in self._gaps), max(gap[1] for gap in self._gaps), min(gap[2] for gap in self._gaps))]
+        rows = Notification.query.filter(
+            or_(*(Notification.id.between(low, high) for low, high, _ in self._gaps))
+        ).order_by(Notification.id).all()
+        # Rows read before a collapse may lie in the merged range
+        return [row for row in rows if row.id not in self._recent]
+
+broker = NotificationBroker()
+
+def wake_after_commit():
+    """Ask the local tailer to pick up rows written by the current transaction"""
+    db.session.info['notifications_written'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _wake_tailer(session):
+    if session.info.pop('notifications_written', False):
+        broker.wake()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_written(session):
+    session.info.pop('notifications_written', None)
@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models.appointment import Appointment
+from app.models.user import User
+from app.services import counters, versions
+from app.services.availability import availability
+from app.utils.validators import validate_appointment_status
+
+# Rows validated, resolved and inserted per transaction
+BATCH_SIZE = 1000
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+class RowError(Exception):
+    pass
+
+def _is_utf8(text):
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def iter_records(stream, fmt):
+    """Yield ``(row_number, record_or_error)`` from a binary CSV or NDJSON stream.
+
+    The stream is read incrementally so memory does not grow with file size.
+    Rows with invalid UTF-8 and undecodable NDJSON lines yield a ``RowError``
+    in place of the record.
+    """
+    # Invalid bytes become lone surrogates instead of aborting the whole read
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='surrogateescape', newline='')
+    if fmt == 'csv':
+        for row_number, record in enumerate(csv.DictReader(text), start=1):
+            # Keys cover a bad header; extra columns come as a list under None
+            fields = [key for key in record if key] + [
+                value for values in record.values() for value in (values if isinstance(values, list) else [values]) if value
+            ]
+            if not all(_is_utf8(field) for field in fields):
+                yield row_number, RowError('invalid UTF-8')
+                continue
+            yield row_number, record
+    elif fmt == 'ndjson':
+        row_number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            row_number += 1
+            if not _is_utf8(line):
+                yield row_number, RowError('invalid UTF-8')
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError('expected a JSON object')
+                yield row_number, record
+            except ValueError as e:
+                yield row_number, RowError(f'invalid JSON: {e}')
+    else:
+        raise ValueError(f'format must be one of {", ".join(IMPORT_FORMATS)}')
+
+def _user_ref(record, prefix):
+    value = record.get(f'{prefix}_id')
+    if value not in (None, ''):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise RowError(f'{prefix}_id must be an integer')
+    email = (record.get(f'{prefix}_email') or '').strip().lower()
+    if not email:
+        raise RowError(f'{prefix}_id or {prefix}_email is required')
+    return email
+
+def _parse(record):
+    """Validate one record, leaving user references unresolved"""
+    if isinstance(record, RowError):
+        raise record
+
+    try:
+        appointment_date = datetime.strptime(str(record.get('appointment_date') or ''), '%Y-%m-%d').date()
+    except ValueError:
+        raise RowError('appointment_date must be YYYY-MM-DD')
+
+    time_str = str(record.get('appointment_time') or '')
+    try:
+        appointment_time = datetime.strptime(time_str[:5], '%H:%M').time()
+    except ValueError:
+        raise RowError('appointment_time must be HH:MM')
+
+    try:
+        duration_minutes = int(record.get('duration_minutes') or 30)
+    except (TypeError, ValueError):
+        raise RowError('duration_minutes must be an integer')
+    if duration_minutes <= 0:
+        raise RowError('duration_minutes must be positive')
+
+    status = record.get('status') or 'completed'
+    if not validate_appointment_status(status):
+        raise RowError(f'invalid status {status!r}')
+
+    return {
+        'patient': _user_ref(record, 'patient'),
+        'doctor': _user_ref(record, 'doctor'),
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+        'duration_minutes': duration_minutes,
+        'status': status,
+        'reason': record.get('reason') or None,
+        'notes': record.get('notes') or None
+    }
+
+def _resolve_users(parsed):
+    """Map every id and email referenced by a batch to ``(id, role)`` in one query"""
+    ids = set()
+    emails = set()
+    for _, row in parsed:
+        for ref in (row['patient'], row['doctor']):
+            (ids if isinstance(ref, int) else emails).add(ref)
+
+    conditions = []
+    if ids:
+        conditions.append(User.id.in_(ids))
+    if emails:
+        conditions.append(User.email.in_(emails))
+    if not conditions:
+        return {}
+
+    users = {}
+    for user_id, email, role in db.session.query(User.id, User.email, User.role).filter(or_(*conditions)):
+        users[user_id] = users[email] = (user_id, role)
+    return users
+
+def _resolve(row, users, prefix, role):
+    user = users.get(row[prefix])
+    if user is None:
+        raise RowError(f'{prefix} {row[prefix]} not found')
+    if user[1] != role:
+        raise RowError(f'{prefix} {row[prefix]} is not a {role}')
+    return user[0]
+
+def _import_batch(batch, on_error):
+    parsed = []
+    for row_number, record in batch:
+        try:
+            parsed.append((row_number, _parse(record)))
+        except RowError as e:
+            on_error(row_number, str(e))
+
+    users = _resolve_users(parsed)
+    timestamp = datetime.utcnow()
+    rows = []
+    row_numbers = []
+    for row_number, row in parsed:
+        try:
+            patient_id = _resolve(row, users, 'patient', 'patient')
+            doctor_id = _resolve(row, users, 'doctor', 'doctor')
+        except RowError as e:
+            on_error(row_number, str(e))
+            continue
+        row_numbers.append(row_number)
+        rows.append(dict(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            appointment_date=row['appointment_date'],
+            appointment_time=row['appointment_time'],
+            duration_minutes=row['duration_minutes'],
+            status=row['status'],
+            reason=row['reason'],
+            notes=row['notes'],
+            created_at=timestamp,
+            updated_at=timestamp
+        ))
+
+    if not rows:
+        return 0
+    try:
+        db.session.execute(insert(Appointment), rows)
+        deltas = Counter()
+        stamps = set()
+        for row in rows:
+            deltas.update(counters.appointment_deltas(row['doctor_id'], row['patient_id'], None, row['status']))
+            stamps.update(versions.appointment_stamps(row['doctor_id'], row['patient_id']))
+        counters.apply(deltas)
+        versions.bump(*stamps)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        for row_number in row_numbers:
+            on_error(row_number, f'batch insert failed: {e.__class__.__name__}')
+        return 0
+    return len(rows)
+
+def import_appointments(records, on_error, batch_size=BATCH_SIZE):
+    """Import ``(row_number, record)`` pairs in chunked transactions.
+
+    ``on_error(row_number, message)`` is called for every rejected row.
+    Returns ``(imported, processed)`` counts.
+    """
+    imported = 0
+    processed = 0
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        processed += len(batch)
+        imported += _import_batch(batch, on_error)
+    # Imported rows may include upcoming appointments
+    availability.clear()
+    return imported, processed
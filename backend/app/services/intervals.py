@@ -0,0 +1,47 @@
+from bisect import bisect_left, bisect_right
+
+def to_minutes(value):
+    """Minutes since midnight for a ``datetime.time``"""
+    return value.hour * 60 + value.minute
+
+class IntervalIndex:
+    """Half-open ``[start, end)`` minute intervals booked for one doctor on one day.
+
+    Intervals are kept sorted by start with a running maximum of their ends,
+    so an overlap query is a single binary search.
+    """
+
+    __slots__ = ('starts', 'ends', 'max_ends')
+
+    def __init__(self, intervals=()):
+        pairs = sorted(intervals)
+        self.starts = [start for start, _ in pairs]
+        self.ends = [end for _, end in pairs]
+        self.max_ends = []
+        self._rebuild_from(0)
+
+    def _rebuild_from(self, index):
+        del self.max_ends[index:]
+        running = self.max_ends[-1] if self.max_ends else 0
+        for end in self.ends[index:]:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def add(self, start, end):
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self._rebuild_from(index)
+
+    def overlaps(self, start, end):
+        """True if ``[start, end)`` intersects any booked interval"""
+        # Only intervals starting before ``end`` can overlap; of those, one
+        # overlaps exactly when the furthest-reaching end is past ``start``
+        index = bisect_left(self.starts, end)
+        return index > 0 and self.max_ends[index - 1] > start
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __len__(self):
+        return len(self.starts)
@@ -0,0 +1,236 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert
+from app import db
+from app.models.appointment import Appointment
+from app.models.notification import Notification, NotificationCursor
+from app.models.resource import Resource
+from app.models.user import User
+from app.services.appointments import with_participant_names, full_name
+from app.services.counters import advance
+from app.services.events import wake_after_commit
+
+# Notifications older than this are removed by the generator
+RETENTION_DAYS = 90
+
+# Source rows read, written and committed per chunk by the generator
+GENERATE_BATCH_SIZE = 1000
+
+# Largest page a client may ask for when polling its feed
+MAX_FEED_LIMIT = 100
+
+def _insert(rows):
+    """Insert notification rows, skipping any whose (user_id, dedupe_key) already exists.
+
+    Runs in the current transaction; the caller commits.
+    """
+    if not rows:
+        return
+    table = Notification.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        statement = insert(table).prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert_insert
+        statement = upsert_insert(table).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert_insert
+        statement = upsert_insert(table).on_conflict_do_nothing()
+    else:
+        statement = insert(table)
+    timestamp = datetime.utcnow()
+    db.session.execute(statement, [
+        dict({'event_date': None, 'dedupe_key': None, 'priority': 'medium', 'created_at': timestamp}, **row)
+        for row in rows
+    ])
+    wake_after_commit()
+
+def _admin_ids():
+    return [user_id for user_id, in db.session.query(User.id).filter(User.role == 'admin', User.is_active == True)]
+
+def _reminder_rows(row):
+    appointment = row[0]
+    appointment_time = appointment.appointment_time.strftime('%H:%M')
+    common = {
+        'type': 'appointment_reminder',
+        'title': 'Upcoming Appointment',
+        'event_date': appointment.appointment_date,
+        'dedupe_key': f'reminder:{appointment.id}'
+    }
+    return [
+        dict(common, user_id=appointment.patient_id,
+             message=f'You have an appointment with Dr. {row.doctor_last_name} tomorrow at {appointment_time}'),
+        dict(common, user_id=appointment.doctor_id,
+             message=f'You have an appointment with {full_name(row.patient_first_name, row.patient_last_name)} tomorrow at {appointment_time}')
+    ]
+
+def _low_stock_rows(resource, admin_ids, today):
+    return [{
+        'user_id': admin_id,
+        'type': 'low_stock',
+        'title': 'Low Stock Alert',
+        'message': f'{resource.name} is running low. Available: {resource.available_quantity}',
+        'priority': 'high',
+        # At most one alert per resource per day, whether raised by a write or the generator
+        'dedupe_key': f'low_stock:{resource.id}:{today.isoformat()}'
+    } for admin_id in admin_ids]
+
+def _expired_rows(resource, admin_ids):
+    return [{
+        'user_id': admin_id,
+        'type': 'expired',
+        'title': 'Expired Medicine',
+        'message': f'{resource.name} has expired on {resource.expiry_date}',
+        'priority': 'high',
+        'event_date': resource.expiry_date,
+        'dedupe_key': f'expired:{resource.id}:{resource.expiry_date.isoformat()}'
+    } for admin_id in admin_ids]
+
+def _write_in_chunks(query, id_column, id_of, to_rows):
+    """Insert ``to_rows(item)`` for every item of ``query``, committing per chunk.
+
+    Each chunk of ``GENERATE_BATCH_SIZE`` items is read by a fresh query
+    keyed on ``id_column``, so no result set is still open while the chunk
+    is written and a long run never holds one transaction.
+    """
+    considered = 0
+    last_id = 0
+    while True:
+        items = query.filter(id_column > last_id).order_by(id_column).limit(GENERATE_BATCH_SIZE).all()
+        if not items:
+            break
+        last_id = id_of(items[-1])
+        rows = [row for item in items for row in to_rows(item)]
+        _insert(rows)
+        db.session.commit()
+        considered += len(rows)
+        if len(items) < GENERATE_BATCH_SIZE:
+            break
+    return considered
+
+def generate(today=None):
+    """Write tomorrow's appointment reminders and the admin stock and expiry alerts.
+
+    Safe to run repeatedly (e.g. hourly from cron): dedupe keys make every
+    insert idempotent, so a run cut short is finished by the next one. Each
+    chunk is committed on its own. Also prunes notifications past
+    ``RETENTION_DAYS``. Returns the number of candidate rows considered.
+    """
+    today = today or date.today()
+    tomorrow = today + timedelta(days=1)
+    admin_ids = _admin_ids()
+
+    reminders = with_participant_names(Appointment.query.filter(
+        Appointment.appointment_date == tomorrow,
+        Appointment.status.in_(['scheduled', 'confirmed'])
+    ))
+    considered = _write_in_chunks(reminders, Appointment.id, lambda row: row[0].id, _reminder_rows)
+
+    if admin_ids:
+        low_stock = Resource.query.filter(Resource.available_quantity <= Resource.min_threshold)
+        considered += _write_in_chunks(low_stock, Resource.id, lambda resource: resource.id,
+                                       lambda resource: _low_stock_rows(resource, admin_ids, today))
+        expired = Resource.query.filter(Resource.resource_type == 'medicine', Resource.expiry_date < today)
+        considered += _write_in_chunks(expired, Resource.id, lambda resource: resource.id,
+                                       lambda resource: _expired_rows(resource, admin_ids))
+
+    db.session.query(Notification).filter(
+        Notification.created_at < datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return considered
+
+def appointment_booked(doctor_id, patient_id, appointment_date, appointment_time, count=1):
+    """Tell the doctor about a new booking; runs inside the booking transaction"""
+    patient = db.session.query(User.first_name, User.last_name).filter(User.id == patient_id).first()
+    patient_name = full_name(*patient) if patient else full_name(None, None)
+    when = f'{appointment_date.isoformat()} at {appointment_time.strftime("%H:%M")}'
+    if count > 1:
+        message = f'{patient_name} booked {count} recurring appointments starting {when}'
+    else:
+        message = f'{patient_name} booked an appointment on {when}'
+    _insert([{
+        'user_id': doctor_id,
+        'type': 'appointment_booked',
+        'title': 'New Appointment',
+        'message': message,
+        'event_date': appointment_date
+    }])
+
+def appointment_status_changed(appointment, actor):
+    """Tell the other participant that an appointment was confirmed or cancelled"""
+    if appointment.status not in ('confirmed', 'cancelled'):
+        return
+    recipient_id = appointment.doctor_id if actor.id == appointment.patient_id else appointment.patient_id
+    when = f'{appointment.appointment_date.isoformat()} at {appointment.appointment_time.strftime("%H:%M")}'
+    _insert([{
+        'user_id': recipient_id,
+        'type': f'appointment_{appointment.status}',
+        'title': f'Appointment {appointment.status.capitalize()}',
+        'message': f'Your appointment on {when} was {appointment.status} by {actor.first_name} {actor.last_name}',
+        'priority': 'high' if appointment.status == 'cancelled' else 'medium',
+        'event_date': appointment.appointment_date
+    }])
+
+def stock_changed(resource, before):
+    """Alert admins when a write takes a resource to or below its threshold.
+
+    ``before`` is the ``counters.resource_snapshot`` taken ahead of the
+    write, or None for a new resource.
+    """
+    was_low = before is not None and before[2] <= (before[3] or 0)
+    if was_low or resource.available_quantity > (resource.min_threshold or 0):
+        return
+    db.session.flush()
+    _insert(_low_stock_rows(resource, _admin_ids(), date.today()))
+
+def feed(user_id, before=None, since=None, limit=20):
+    """One page of a user's feed, newest first, and the user's read cursor.
+
+    Both come from a single query on ``(user_id, id)``; the cursor is only
+    looked up separately when the page is empty. ``before`` pages to
+    older notifications, ``since`` returns only ones newer than an id the
+    client has already seen.
+    """
+    query = db.session.query(Notification, NotificationCursor.last_read_id).outerjoin(
+        NotificationCursor, NotificationCursor.user_id == Notification.user_id
+    ).filter(Notification.user_id == user_id)
+    if before:
+        query = query.filter(Notification.id < before)
+    if since:
+        query = query.filter(Notification.id > since)
+
+    limit = min(limit, MAX_FEED_LIMIT)
+    rows = query.order_by(Notification.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        last_read_id = rows[0][1] or 0
+    else:
+        cursor = db.session.get(NotificationCursor, user_id)
+        last_read_id = cursor.last_read_id if cursor else 0
+    return [notification for notification, _ in rows], last_read_id, has_more
+
+def unread_count(user_id, last_read_id):
+    """All of a user's notifications after the read cursor, counted on ``(user_id, id)``"""
+    return db.session.query(func.count(Notification.id)).filter(
+        Notification.user_id == user_id,
+        Notification.id > last_read_id
+    ).scalar()
+
+def replay(user_id, after_id, limit=MAX_FEED_LIMIT):
+    """Up to ``limit`` of a user's notifications newer than ``after_id``, oldest first"""
+    return Notification.query.filter(
+        Notification.user_id == user_id,
+        Notification.id > after_id
+    ).order_by(Notification.id).limit(limit).all()
+
+def mark_read(user_id, last_read_id):
+    """Advance the user's read cursor; it never moves backwards.
+
+    A single upsert, so concurrent first reads cannot both insert the row.
+    """
+    advance(NotificationCursor.__table__, ('user_id',), 'last_read_id', [
+        {'user_id': user_id, 'last_read_id': last_read_id, 'updated_at': datetime.utcnow()}
+    ])
+    db.session.commit()
+    return db.session.query(NotificationCursor.last_read_id).filter(NotificationCursor.user_id == user_id).scalar()
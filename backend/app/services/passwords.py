@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Werkzeug method string for new hashes, overridable with PASSWORD_HASH_METHOD
+# (e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000')
+HASH_METHOD = 'scrypt:32768:8:1'
+SALT_LENGTH = 16
+
+# Hashing processes per server worker, overridable with PASSWORD_HASH_WORKERS
+# in the config or the environment; 0 hashes inline on the request thread.
+# Every server worker starts its own pool, so by default the host's cores
+# are split between the WEB_CONCURRENCY workers, at least one each
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS') or max(
+    min((os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY') or 1), 4), 1
+))
+
+# Hashes allowed to wait for a process on top of the running ones
+# (PASSWORD_HASH_QUEUE); further requests wait up to PASSWORD_HASH_WAIT
+# seconds for room and are then refused
+HASH_QUEUE = 16
+HASH_WAIT = 2
+
+class HashingBusy(Exception):
+    """All hashing processes are busy and the queue is full"""
+    pass
+
+class _HashPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pid = None
+
+    def _ensure(self, workers, queue):
+        # A pool inherited across fork belongs to the parent
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    self._slots = threading.BoundedSemaphore(workers + queue)
+                    self._pid = os.getpid()
+        return self._executor, self._slots
+
+    def run(self, fn, *args):
+        config = current_app.config
+        workers = config.get('PASSWORD_HASH_WORKERS', HASH_WORKERS)
+        if not workers:
+            return fn(*args)
+
+        executor, slots = self._ensure(workers, config.get('PASSWORD_HASH_QUEUE', HASH_QUEUE))
+        if not slots.acquire(timeout=config.get('PASSWORD_HASH_WAIT', HASH_WAIT)):
+            raise HashingBusy()
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+_pool = _HashPool()
+
+def _method():
+    return current_app.config.get('PASSWORD_HASH_METHOD', HASH_METHOD)
+
+@lru_cache(maxsize=8)
+def _stored_method(method):
+    # The prefix Werkzeug writes for ``method``, with its defaults filled in
+    # ('scrypt' is stored as 'scrypt:32768:8:1'); computed once per setting
+    return generate_password_hash('', method, 1).split('$', 1)[0]
+
+def hash_password(password):
+    """Hash with the configured method in the hashing pool; raises ``HashingBusy``"""
+    return _pool.run(generate_password_hash, password, _method(),
+                     current_app.config.get('PASSWORD_SALT_LENGTH', SALT_LENGTH))
+
+def verify_password(password_hash, password):
+    """Check a password in the hashing pool; raises ``HashingBusy``.
+
+    Returns ``(matches, needs_rehash)`` where ``needs_rehash`` is set when
+    the stored hash was made with a method other than the configured one.
+    """
+    if not password_hash:
+        return False, False
+    matches = _pool.run(check_password_hash, password_hash, password)
+    return matches, matches and password_hash.split('$', 1)[0] != _stored_method(_method())
+
+def shutdown():
+    """Stop this process's hashing workers"""
+    _pool.shutdown()
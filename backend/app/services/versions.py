@@ -0,0 +1,48 @@
+from app import db
+from app.models.dashboard import VersionStamp
+from app.services.counters import APPOINTMENT_SHARDS, appointment_shard, increment
+
+# Stamps covering the list endpoints that polling clients revalidate
+USERS = 'users'
+DOCTORS = 'doctors'
+RESOURCES = 'resources'
+# Split like the hospital-wide counters: an appointment bumps its doctor's
+# shard, and the stamp is read as the sum of the shards
+APPOINTMENTS = 'appointments'
+# Bumped when the dashboard counters are rebuilt from the source tables
+COUNTERS = 'counters'
+
+def doctor_appointments(doctor_id):
+    return f'{APPOINTMENTS}:doctor:{int(doctor_id)}'
+
+def patient_appointments(patient_id):
+    return f'{APPOINTMENTS}:patient:{int(patient_id)}'
+
+def _appointment_shard(shard):
+    return f'{APPOINTMENTS}:shard:{shard}'
+
+APPOINTMENT_SHARD_STAMPS = [_appointment_shard(shard) for shard in range(APPOINTMENT_SHARDS)]
+
+def appointment_stamps(doctor_id, patient_id):
+    """Every stamp an appointment between these two users is visible under"""
+    return (_appointment_shard(appointment_shard(doctor_id)), doctor_appointments(doctor_id), patient_appointments(patient_id))
+
+def bump(*names):
+    """Advance the named stamps in the current transaction; the caller commits"""
+    names = sorted(set(names))  # A fixed order so concurrent bumps cannot deadlock
+    if names:
+        increment(VersionStamp.__table__, ('name',), 'version', [{'name': name, 'version': 1} for name in names])
+
+def current(names):
+    """``{name: version}`` for ``names`` in one primary key lookup; unseen names are 0"""
+    versions = dict.fromkeys(names, 0)
+    lookup = [name for name in versions if name != APPOINTMENTS]
+    if APPOINTMENTS in versions:
+        lookup += APPOINTMENT_SHARD_STAMPS
+    for name, version in db.session.query(VersionStamp.name, VersionStamp.version).filter(VersionStamp.name.in_(lookup)):
+        if name in APPOINTMENT_SHARD_STAMPS:
+            # Shard stamps only grow, so their sum changes whenever any of them does
+            versions[APPOINTMENTS] += version
+        else:
+            versions[name] = version
+    return versions
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt
+from app import db
+from app.models.user import User, RevokedToken
+from app.utils.metrics import cache_stats
+from app.utils.routing import primary
+
+# Seconds a cached user record is trusted; bounds how long another worker
+# may keep honouring a token after activate/deactivate
+USER_CACHE_TTL = 30
+
+# Most user records kept per process
+USER_CACHE_SIZE = 10000
+
+# The columns routes read from the current user, loaded without the full row
+AuthenticatedUser = namedtuple('AuthenticatedUser', [
+    'id', 'email', 'first_name', 'last_name', 'role', 'is_active', 'auth_version'
+])
+
+# Seconds between reads of tokens revoked by other workers
+BLOCKLIST_SYNC_SECONDS = 5
+
+# Each sync re-reads rows revoked this long before the previous one. Ids and
+# revoked_at are assigned before commit, so a row can become visible after
+# newer ones; the window must outlast the slowest revoking transaction plus
+# clock skew between workers
+BLOCKLIST_SYNC_OVERLAP_SECONDS = 120
+
+# Expired rows are deleted from revoked_tokens at most this often
+BLOCKLIST_PRUNE_SECONDS = 3600
+
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+_user_cache_stats = cache_stats('users')
+
+def _claims(user):
+    return {'role': user.role, 'ver': user.auth_version}
+
+def create_user_token(user):
+    """Access token carrying the user's role and auth version as claims"""
+    return create_access_token(identity=str(user.id), additional_claims=_claims(user))
+
+def create_user_tokens(user):
+    """``(access_token, refresh_token)`` for a sign-in or a refresh"""
+    return create_user_token(user), create_refresh_token(identity=str(user.id), additional_claims=_claims(user))
+
+def _load_user(user_id):
+    row = db.session.query(
+        User.id, User.email, User.first_name, User.last_name, User.role, User.is_active, User.auth_version
+    ).filter(User.id == user_id).first()
+    return AuthenticatedUser(*row) if row else None
+
+def cached_user(user_id, min_version=None):
+    """User record from the process cache, re-read when older than ``USER_CACHE_TTL``.
+
+    A record older than ``min_version`` is re-read too, so a token minted
+    after a version bump in another worker is not rejected here.
+    """
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+        if cached and now - cached[1] < USER_CACHE_TTL and (min_version is None or cached[0].auth_version >= min_version):
+            _user_cache.move_to_end(user_id)
+            _user_cache_stats.hits += 1
+            return cached[0]
+
+    _user_cache_stats.misses += 1
+    record = _load_user(user_id)
+    if record is None:
+        return None
+    with _user_cache_lock:
+        _user_cache[user_id] = (record, now)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return record
+
+def invalidate_user(user_id):
+    """Drop a user's cached record after changing role, status or version"""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+def _token_user(claims):
+    try:
+        user_id = int(claims['sub'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    version = claims.get('ver')
+    if not isinstance(version, int):
+        return None
+    record = cached_user(user_id, min_version=version)
+    if record is None or not record.is_active or record.auth_version != version:
+        return None
+    return record
+
+def load_current_user():
+    """The authenticated user as an ``AuthenticatedUser``, or None.
+
+    Replaces ``User.query.get(get_jwt_identity())`` on the hot path: the
+    record normally comes from the process cache, and tokens from before
+    the user's last activate/deactivate are treated as having no user.
+    """
+    return _token_user(get_jwt())
+
+class _Blocklist:
+    """Unexpired revoked JTIs held in memory in front of the revoked_tokens table.
+
+    Lookups never touch the database. Every ``BLOCKLIST_SYNC_SECONDS`` one
+    request per worker reads the rows revoked since shortly before the last
+    sync (entries are keyed by jti, so re-reads are harmless), and expired
+    entries are dropped here and deleted from the table.
+    """
+    
+    def __init__(self):
+        self._revoked = {}
+        self._synced_through = None
+        self._synced_at = 0.0
+        self._pruned_at = time.monotonic()
+        self._sync_lock = threading.Lock()
+    
+    def add(self, jti, expires_at):
+        self._revoked[jti] = expires_at
+    
+    def __contains__(self, jti):
+        self._maybe_sync()
+        return jti in self._revoked
+    
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if now - self._synced_at < BLOCKLIST_SYNC_SECONDS or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._synced_at = now
+            utcnow = datetime.utcnow()
+            query = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(RevokedToken.expires_at > utcnow)
+            if self._synced_through is not None:
+                query = query.filter(
+                    RevokedToken.revoked_at >= self._synced_through - timedelta(seconds=BLOCKLIST_SYNC_OVERLAP_SECONDS)
+                )
+            # A lagging replica would let a just-revoked token through
+            with primary():
+                rows = query.all()
+            for jti, expires_at in rows:
+                self._revoked[jti] = expires_at
+            self._synced_through = utcnow
+            
+            for jti, expires_at in list(self._revoked.items()):
+                if expires_at <= utcnow:
+                    self._revoked.pop(jti, None)
+            if now - self._pruned_at >= BLOCKLIST_PRUNE_SECONDS:
+                self._pruned_at = now
+                RevokedToken.query.filter(RevokedToken.expires_at <= utcnow).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            # Keep serving from the entries already loaded
+            db.session.rollback()
+            current_app.logger.exception('Could not sync the token blocklist')
+        finally:
+            self._sync_lock.release()
+
+_blocklist = _Blocklist()
+
+def revoke_token(jwt_payload):
+    """Add a decoded token to the blocklist; the caller commits"""
+    expires_at = datetime.utcfromtimestamp(jwt_payload['exp'])
+    db.session.add(RevokedToken(
+        jti=jwt_payload['jti'],
+        token_type=jwt_payload.get('type', 'access'),
+        user_id=int(jwt_payload['sub']),
+        expires_at=expires_at
+    ))
+    _blocklist.add(jwt_payload['jti'], expires_at)
+
+def register_jwt_callbacks(jwt):
+    """Reject revoked tokens and tokens with a stale auth version with a 401"""
+    @jwt.token_in_blocklist_loader
+    def token_is_revoked(jwt_header, jwt_payload):
+        if jwt_payload['jti'] in _blocklist:
+            return True
+        return _token_user(jwt_payload) is None
@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+from datetime import date
+from functools import wraps
+from flask import current_app, make_response, request
+from app.services import versions
+from app.utils.auth import load_current_user
+
+try:
+    import brotli
+except ImportError:  # Optional; responses are gzip-only without it
+    brotli = None
+
+# Smaller bodies are sent as they are; compressing them costs more than it saves
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = ('application/json',)
+
+def _etag(user, versions_by_name):
+    # The URL covers pagination and filters, the user covers role scoping and
+    # the date covers "upcoming" and "expired", which change without a write
+    key = repr((sorted(versions_by_name.items()), request.full_path, user.id, user.role, date.today().isoformat()))
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+def conditional(stamps, current=None):
+    """Answer ``If-None-Match`` from version stamps before the view runs.
+
+    ``stamps(user)`` returns the names of the ``versions`` stamps the
+    response depends on, or None to always run the view (e.g. so it can
+    refuse access). Use below ``@jwt_required()``. A matching request costs
+    one stamp lookup and gets a 304; otherwise the 200 response carries a
+    weak ETag. The stamps are read before the view, so a write that lands
+    in between only costs the client one extra full response. ``current``
+    replaces ``versions.current`` for views served from an in-process copy
+    that must be tagged with the version it holds.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user = load_current_user()
+            names = stamps(user) if user else None
+            if not names:
+                return view(*args, **kwargs)
+
+            etag = _etag(user, (current or versions.current)(names))
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Browsers must revalidate every time rather than reuse the copy
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def admin_only(*names):
+    """``stamps`` for an admin-only view; other roles always reach the view's 403"""
+    return lambda user: names if user.role == 'admin' else None
+
+def _encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def compress_response(response):
+    """Compress a finished JSON response with brotli or gzip when the client accepts it"""
+    config = current_app.config
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in config.get('COMPRESS_MIMETYPES', COMPRESS_MIMETYPES)
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < config.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE):
+        return response
+    encoding = request.accept_encodings.best_match(_encodings())
+    if encoding is None:
+        return response
+
+    level = config.get('COMPRESS_LEVEL', COMPRESS_LEVEL)
+    if encoding == 'br':
+        # Brotli quality runs 0-11; map the gzip-style level onto it
+        response.set_data(brotli.compress(data, quality=min(11, level)))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def register_compression(app):
+    """Compress large JSON responses for every blueprint on ``app``"""
+    if app.config.get('COMPRESS_ENABLED', True):
+        app.after_request(compress_response)
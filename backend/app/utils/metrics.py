@@ -0,0 +1,486 @@
+"""Prometheus metrics shared by every worker of a prefork server.
+
+Each process adds to float slots in its own file under ``METRICS_DIR``
+(``metrics_<pid>.db``) and ``/metrics`` sums the files of all workers, so
+any worker can answer a scrape. Recording is a dict lookup and an add into
+the mmap, with no system call. Counters of exited workers are folded into
+``archive.db`` by gunicorn's ``child_exit`` hook; their gauges are dropped.
+Without ``METRICS_DIR`` the slots live in memory and cover this process only.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, request
+from app.utils import profiling
+from app.utils.pool import WAIT_BUCKETS_MS
+
+# Request latency histogram bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Database time per request histogram bounds in seconds
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Pool, cache and limiter counters are copied into the store at most this often per worker
+PUBLISH_SECONDS = 1.0
+
+_INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct('<Q')
+_KEY_LENGTH = struct.Struct('<I')
+
+class MetricsStore:
+    """Float slots keyed by ``(sample name, label values)`` in this process's file.
+
+    Entries are appended as ``[key length][key][padding][float64]`` with
+    the value 8-byte aligned, and the used size in the header is written
+    after the entry, so readers never see half an entry.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._offsets = {}
+        self._groups = {}
+        self._file = None
+        self._buffer = None
+        self._values = None
+        self._used = _HEADER.size
+
+    def _open(self):
+        # Preloaded workers inherit the master's store; each process gets its own file
+        self._close()
+        self._pid = os.getpid()
+        self._offsets = {}
+        self._groups = {}
+        self._used = _HEADER.size
+        if self.directory is None:
+            self._buffer = bytearray(_INITIAL_SIZE)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(os.path.join(self.directory, f'metrics_{self._pid}.db'), 'w+b')
+            self._file.truncate(_INITIAL_SIZE)
+            self._buffer = mmap.mmap(self._file.fileno(), _INITIAL_SIZE)
+        _HEADER.pack_into(self._buffer, 0, self._used)
+        self._values = memoryview(self._buffer).cast('d')
+
+    def _close(self):
+        if self._values is not None:
+            self._values.release()
+            self._values = None
+        if self._file is not None:
+            self._buffer.close()
+            self._file.close()
+            self._file = None
+
+    def _grow(self, size):
+        new_size = max(len(self._buffer) * 2, size)
+        self._values.release()
+        if self._file is None:
+            self._buffer = self._buffer + bytearray(new_size - len(self._buffer))
+        else:
+            self._buffer.close()
+            self._file.truncate(new_size)
+            self._buffer = mmap.mmap(self._file.fileno(), new_size)
+        self._values = memoryview(self._buffer).cast('d')
+
+    def _slot(self, key):
+        if self._pid != os.getpid():
+            self._open()
+        encoded = json.dumps(key).encode()
+        padding = -(_KEY_LENGTH.size + len(encoded)) % 8
+        offset = self._used + _KEY_LENGTH.size + len(encoded) + padding
+        if offset + 8 > len(self._buffer):
+            self._grow(offset + 8)
+        _KEY_LENGTH.pack_into(self._buffer, self._used, len(encoded))
+        self._buffer[self._used + _KEY_LENGTH.size:self._used + _KEY_LENGTH.size + len(encoded)] = encoded
+        self._values[offset // 8] = 0.0
+        self._used = offset + 8
+        _HEADER.pack_into(self._buffer, 0, self._used)
+        index = self._offsets[key] = offset // 8
+        return index
+
+    def configure(self, directory):
+        """Switch to ``directory`` (None for memory); the store reopens on the next request"""
+        with self._lock:
+            if directory != self.directory:
+                self._close()
+                self.directory = directory
+                self._pid = None
+
+    def check_process(self):
+        """Reopen after a fork; called once per request rather than per write"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._open()
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            index = self._offsets.get(key)
+            if index is None:
+                index = self._slot(key)
+            self._values[index] += amount
+
+    def set(self, key, value):
+        with self._lock:
+            index = self._offsets.get(key)
+            if index is None:
+                index = self._slot(key)
+            self._values[index] = value
+
+    def update(self, group, keys, apply):
+        """Call ``apply(values, indices)`` under the lock with the slots of ``keys(*group)``.
+
+        The keys are resolved once per group and process, so the hot path is
+        one dict lookup and plain float adds.
+        """
+        with self._lock:
+            indices = self._groups.get(group)
+            if indices is None:
+                if self._pid != os.getpid():
+                    self._open()
+                indices = self._groups[group] = tuple(
+                    self._offsets[key] if key in self._offsets else self._slot(key) for key in keys(*group)
+                )
+            apply(self._values, indices)
+
+    def items(self):
+        """This process's ``(key, value)`` pairs"""
+        with self._lock:
+            if self._buffer is None:
+                return []
+            return list(_entries(bytes(self._buffer[:self._used])))
+
+def _entries(data):
+    used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+    position = _HEADER.size
+    while position + _KEY_LENGTH.size <= used:
+        length = _KEY_LENGTH.unpack_from(data, position)[0]
+        start = position + _KEY_LENGTH.size
+        offset = start + length + (-(_KEY_LENGTH.size + length) % 8)
+        if offset + 8 > used:
+            break
+        name, labels = json.loads(data[start:start + length])
+        yield (name, tuple(labels)), struct.unpack_from('<d', data, offset)[0]
+        position = offset + 8
+
+def _read_file(path):
+    try:
+        with open(path, 'rb') as file:
+            return list(_entries(file.read()))
+    except (OSError, ValueError, struct.error):
+        return []
+
+_store = MetricsStore(os.getenv('METRICS_DIR') or None)
+
+# Kind of every sample name, for merging and for ``# TYPE`` lines
+_KINDS = {}
+_METRICS = []
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _METRICS.append(self)
+        for sample in self.samples():
+            _KINDS[sample] = self.kind
+
+    def samples(self):
+        return (self.name,)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, label_values=(), amount=1.0):
+        _store.inc((self.name, label_values), amount)
+
+    def set_total(self, label_values, value):
+        """Publish a running total kept elsewhere in this process"""
+        _store.set((self.name, label_values), value)
+
+class Gauge(_Metric):
+    """Summed over live workers"""
+
+    kind = 'gauge'
+
+    def inc(self, label_values=(), amount=1.0):
+        _store.inc((self.name, label_values), amount)
+
+    def set(self, label_values, value):
+        _store.set((self.name, label_values), value)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._bounds = tuple(_format(bound) for bound in self.buckets) + ('+Inf',)
+        super().__init__(name, documentation, labels)
+
+    def samples(self):
+        return (self.name + '_bucket', self.name + '_sum', self.name + '_count')
+
+    def bucket_keys(self, label_values):
+        """Keys of every bound's bucket followed by the count"""
+        return tuple((self.name + '_bucket', label_values + (bound,)) for bound in self._bounds) + (
+            (self.name + '_count', label_values),
+        )
+
+    def observe(self, value, label_values=()):
+        # Buckets are stored per bound and made cumulative when rendered
+        bound = self._bounds[bisect_left(self.buckets, value)]
+        _store.inc((self.name + '_bucket', label_values + (bound,)))
+        _store.inc((self.name + '_sum', label_values), value)
+        _store.inc((self.name + '_count', label_values))
+
+    def set_buckets(self, label_values, counts, total):
+        """Publish a histogram kept elsewhere in this process as per-bound counts and a sum"""
+        for bound, count in zip(self._bounds, counts):
+            _store.set((self.name + '_bucket', label_values + (bound,)), count)
+        _store.set((self.name + '_sum', label_values), total)
+        _store.set((self.name + '_count', label_values), sum(counts))
+
+def _format(value):
+    return repr(float(value)) if value != int(value) else f'{int(value)}.0'
+
+class CacheStats:
+    """Hit and miss counts of one in-process cache.
+
+    Bumped without a lock: a lost increment under contention only nudges
+    the ratio, and the counts reach the store once per ``PUBLISH_SECONDS``.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+_caches = {}
+
+def cache_stats(name):
+    """The ``CacheStats`` published as ``harms_cache_requests_total{cache=name}``"""
+    return _caches.setdefault(name, CacheStats())
+
+REQUESTS = Counter('harms_http_requests_total', 'HTTP requests by route and status',
+                   ('endpoint', 'method', 'status'))
+LATENCY = Histogram('harms_http_request_duration_seconds', 'Time from routing to response',
+                    ('endpoint', 'method'))
+IN_FLIGHT = Gauge('harms_http_requests_in_flight', 'Requests being handled')
+DB_TIME = Histogram('harms_db_request_duration_seconds', 'Database time per request',
+                    ('endpoint',), buckets=DB_BUCKETS)
+DB_QUERIES = Counter('harms_db_queries_total', 'SQL statements run by requests', ('endpoint',))
+CACHE_REQUESTS = Counter('harms_cache_requests_total', 'In-process cache lookups', ('cache', 'result'))
+RATE_LIMITED = Counter('harms_rate_limit_requests_total', 'Rate limiter decisions', ('limiter', 'result'))
+POOL_CONNECTIONS = Gauge('harms_db_pool_connections', 'Pooled connections by state', ('bind', 'state'))
+POOL_EVENTS = Counter('harms_db_pool_events_total', 'Connection pool events', ('bind', 'event'))
+POOL_WAIT = Histogram('harms_db_pool_wait_seconds', 'Time waiting for a pooled connection', ('bind',),
+                      buckets=tuple(bound / 1000 for bound in WAIT_BUCKETS_MS))
+
+_published_at = float('-inf')
+_publish_lock = threading.Lock()
+
+def _publish(engines):
+    """Copy the process's pool, cache and limiter counters into the store"""
+    from app.utils.pool import pool_stats
+    from app.utils.ratelimit import limiter_stats
+
+    for bind, stats in pool_stats(engines).items():
+        for state in ('checked_out', 'checked_in', 'overflow_in_use'):
+            if state in stats:
+                POOL_CONNECTIONS.set((bind, state), stats[state])
+        for event in ('checkouts', 'connects', 'invalidations', 'soft_invalidations', 'overflow_connections', 'timeouts'):
+            if event in stats:
+                POOL_EVENTS.set_total((bind, event), stats[event])
+        if 'wait_ms' in stats:
+            wait = stats['wait_ms']
+            POOL_WAIT.set_buckets((bind,), list(wait['buckets'].values()), wait['mean'] * wait['count'] / 1000)
+    for name, stats in list(_caches.items()):
+        CACHE_REQUESTS.set_total((name, 'hit'), stats.hits)
+        CACHE_REQUESTS.set_total((name, 'miss'), stats.misses)
+    for name, stats in limiter_stats().items():
+        RATE_LIMITED.set_total((name, 'allowed'), stats.get('allowed', 0))
+        RATE_LIMITED.set_total((name, 'rejected'), stats.get('rejected', 0))
+
+def _maybe_publish():
+    global _published_at
+    now = time.monotonic()
+    if now - _published_at < PUBLISH_SECONDS or not _publish_lock.acquire(blocking=False):
+        return
+    try:
+        _published_at = now
+        _publish(current_app.extensions['sqlalchemy'].engines)
+    except Exception:
+        current_app.logger.exception('Could not publish process metrics')
+    finally:
+        _publish_lock.release()
+
+def _request_keys(endpoint, method, status):
+    # Slot layout used by _finish_request: five scalars, then each histogram's buckets
+    return (
+        (REQUESTS.name, (endpoint, method, str(status))),
+        (IN_FLIGHT.name, ()),
+        (DB_QUERIES.name, (endpoint,)),
+        (LATENCY.name + '_sum', (endpoint, method)),
+        (DB_TIME.name + '_sum', (endpoint,)),
+    ) + LATENCY.bucket_keys((endpoint, method)) + DB_TIME.bucket_keys((endpoint,))
+
+_LATENCY_SLOTS = 5
+_DB_SLOTS = _LATENCY_SLOTS + len(LATENCY_BUCKETS) + 2
+
+# Kept in the WSGI environ: going through the ``g`` proxy costs more than the recording
+_ENVIRON_KEY = 'harms.metrics'
+
+def _start_request():
+    _store.check_process()
+    IN_FLIGHT.inc()
+    request.environ[_ENVIRON_KEY] = (time.perf_counter(), profiling.start(profiling.QueryTimer()))
+
+def _finish_request(response):
+    current = request._get_current_object()
+    started, timer = current.environ.pop(_ENVIRON_KEY, (None, None))
+    if started is None:
+        return response
+    profiling.stop(timer)
+    elapsed = time.perf_counter() - started
+    db_seconds = timer.total_ms / 1000
+
+    def apply(values, slots):
+        values[slots[0]] += 1
+        values[slots[1]] -= 1
+        values[slots[2]] += timer.count
+        values[slots[3]] += elapsed
+        values[slots[4]] += db_seconds
+        values[slots[_LATENCY_SLOTS + bisect_left(LATENCY.buckets, elapsed)]] += 1
+        values[slots[_LATENCY_SLOTS + len(LATENCY_BUCKETS) + 1]] += 1
+        values[slots[_DB_SLOTS + bisect_left(DB_TIME.buckets, db_seconds)]] += 1
+        values[slots[_DB_SLOTS + len(DB_BUCKETS) + 1]] += 1
+
+    # One locked update per request instead of one per sample
+    _store.update((current.endpoint or 'unmatched', current.method, response.status_code), _request_keys, apply)
+    _maybe_publish()
+    return response
+
+def _abandon_request(error=None):
+    # Requests that raised past after_request still leave the gauge and thread clean
+    started, timer = request.environ.pop(_ENVIRON_KEY, (None, None))
+    if started is not None:
+        profiling.stop(timer)
+        IN_FLIGHT.inc(amount=-1.0)
+
+def register_metrics(app):
+    """Record request counts, latency and DB time for every request to ``app``"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    _store.configure(app.config.get('METRICS_DIR'))
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_abandon_request)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _files(directory):
+    """``(pid or None for the archive, path)`` of every store in ``directory``"""
+    for path in glob.glob(os.path.join(directory, 'metrics_*.db')):
+        pid = os.path.basename(path)[len('metrics_'):-len('.db')]
+        if pid.isdigit():
+            yield int(pid), path
+    archive = os.path.join(directory, 'archive.db')
+    if os.path.exists(archive):
+        yield None, archive
+
+def collect():
+    """``{(sample name, label values): value}`` summed over this server's workers"""
+    _store.check_process()
+    if _store.directory is None:
+        sources = [(os.getpid(), _store.items())]
+    else:
+        sources = [(pid, _read_file(path)) for pid, path in _files(_store.directory)]
+    totals = {}
+    for pid, items in sources:
+        live = pid is not None and (pid == os.getpid() or _pid_alive(pid))
+        for key, value in items:
+            kind = _KINDS.get(key[0])
+            if kind is None or (kind == 'gauge' and not live):
+                continue
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _sample(name, label_names, label_values, value):
+    labels = ','.join(f'{label}="{_escape(str(item))}"' for label, item in zip(label_names, label_values))
+    number = str(int(value)) if value.is_integer() else repr(value)
+    return f'{name}{{{labels}}} {number}' if labels else f'{name} {number}'
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    totals = collect()
+    by_name = {}
+    for (name, label_values), value in totals.items():
+        by_name.setdefault(name, []).append((label_values, value))
+    lines = []
+    for metric in _METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind != 'histogram':
+            for label_values, value in sorted(by_name.get(metric.name, ())):
+                lines.append(_sample(metric.name, metric.labels, label_values, value))
+            continue
+        per_series = {}
+        for label_values, value in by_name.get(metric.name + '_bucket', ()):
+            per_series.setdefault(label_values[:-1], {})[label_values[-1]] = value
+        sums = dict(by_name.get(metric.name + '_sum', ()))
+        counts = dict(by_name.get(metric.name + '_count', ()))
+        label_names = metric.labels + ('le',)
+        for label_values in sorted(per_series):
+            cumulative = 0.0
+            for bound in metric._bounds:
+                cumulative += per_series[label_values].get(bound, 0.0)
+                lines.append(_sample(metric.name + '_bucket', label_names, label_values + (bound,), cumulative))
+            lines.append(_sample(metric.name + '_sum', metric.labels, label_values, sums.get(label_values, 0.0)))
+            lines.append(_sample(metric.name + '_count', metric.labels, label_values, counts.get(label_values, 0.0)))
+    return '\n'.join(lines) + '\n'
+
+def retire(pid, directory=None):
+    """Fold an exited worker's counters into the archive; gunicorn's ``child_exit`` calls this"""
+    directory = directory or _store.directory
+    if directory is None:
+        return
+    path = os.path.join(directory, f'metrics_{pid}.db')
+    if not os.path.exists(path):
+        return
+    archive = os.path.join(directory, 'archive.db')
+    totals = dict(_read_file(archive)) if os.path.exists(archive) else {}
+    for key, value in _read_file(path):
+        if _KINDS.get(key[0]) not in (None, 'gauge'):
+            totals[key] = totals.get(key, 0.0) + value
+    # Written aside and renamed so a concurrent scrape reads the old or the new archive
+    store = MetricsStore(None)
+    store._open()
+    for key, value in totals.items():
+        store.set(key, value)
+    temporary = archive + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(bytes(store._buffer[:store._used]))
+    os.replace(temporary, archive)
+    os.unlink(path)
+
+def reset(directory):
+    """Remove the stores of a previous server; gunicorn's ``on_starting`` calls this"""
+    for _, path in _files(directory):
+        os.unlink(path)
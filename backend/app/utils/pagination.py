@@ -0,0 +1,98 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time
+from sqlalchemy import and_, or_
+from app.utils.metrics import cache_stats
+
+# Largest per_page a list endpoint serves
+MAX_PER_PAGE = 100
+
+# Seconds an approximate total is reused before it is recounted
+APPROX_TOTAL_TTL = 60
+
+_total_cache = OrderedDict()
+_total_lock = threading.Lock()
+_TOTAL_CACHE_SIZE = 1024
+_total_stats = cache_stats('page_totals')
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime, dt_time)):
+        return value.isoformat()
+    return value
+
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if value is None or python_type in (int, str, bool):
+        return value
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is dt_time:
+        return dt_time.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(values):
+    """Opaque token for the sort key of the last row on a page"""
+    raw = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Turn a token back into typed sort key values; raises ValueError when invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    try:
+        return [_decode_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def _after(columns, values):
+    """``(c1, c2, ...) > (v1, v2, ...)`` expanded so any index on the columns can be used"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, column > values[i]))
+    return or_(*clauses)
+
+def keyset_paginate(query, columns, cursor, per_page, entity_of=None):
+    """Fetch the page after ``cursor`` ordered by ``columns`` without OFFSET or COUNT.
+
+    ``columns`` must end in a unique column so the order is total. Returns
+    ``(items, next_cursor)`` where ``next_cursor`` is None on the last page.
+    """
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns)))
+
+    items = query.order_by(*columns).limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+
+    items = items[:per_page]
+    last = entity_of(items[-1]) if entity_of else items[-1]
+    return items, encode_cursor([getattr(last, column.key) for column in columns])
+
+def approximate_total(cache_key, query, ttl=APPROX_TOTAL_TTL):
+    """Row count for ``query``, recomputed at most every ``ttl`` seconds per key"""
+    now = time.monotonic()
+    with _total_lock:
+        cached = _total_cache.get(cache_key)
+        if cached and now - cached[1] < ttl:
+            _total_stats.hits += 1
+            return cached[0]
+
+    _total_stats.misses += 1
+    total = query.order_by(None).count()
+    with _total_lock:
+        _total_cache[cache_key] = (total, now)
+        _total_cache.move_to_end(cache_key)
+        while len(_total_cache) > _TOTAL_CACHE_SIZE:
+            _total_cache.popitem(last=False)
+    return total
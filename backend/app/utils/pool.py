@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+import weakref
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# Pool settings per deployment profile (DB_POOL_PROFILE), each overridable
+# with DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and
+# DB_POOL_PRE_PING. The sum over workers of pool_size + max_overflow must
+# stay under MySQL's max_connections. Recycling well inside wait_timeout
+# and pinging on checkout keep connections left idle overnight from
+# failing the first requests of the morning.
+POOL_PROFILES = {
+    # Flask development server: a few threads, generous waits
+    'development': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 3600, 'pool_pre_ping': True},
+    # Sync gunicorn workers run one request at a time, plus the notification tailer
+    'production': {'pool_size': 3, 'max_overflow': 2, 'pool_timeout': 5, 'pool_recycle': 1800, 'pool_pre_ping': True},
+    # gevent workers interleave many requests over one pool
+    'gevent': {'pool_size': 20, 'max_overflow': 10, 'pool_timeout': 5, 'pool_recycle': 1800, 'pool_pre_ping': True},
+}
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+_OVERRIDES = (
+    ('DB_POOL_SIZE', 'pool_size', int),
+    ('DB_MAX_OVERFLOW', 'max_overflow', int),
+    ('DB_POOL_TIMEOUT', 'pool_timeout', int),
+    ('DB_POOL_RECYCLE', 'pool_recycle', int),
+    ('DB_POOL_PRE_PING', 'pool_pre_ping', _flag),
+)
+
+# Upper bounds in milliseconds of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class PoolMetrics:
+    """Counters for one engine's pool in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.overflow_connections = 0
+        self.timeouts = 0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def observe_wait(self, milliseconds, timed_out=False):
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS_MS) if milliseconds <= bound), len(WAIT_BUCKETS_MS))
+        with self._lock:
+            self.wait_buckets[index] += 1
+            self.wait_count += 1
+            self.wait_total_ms += milliseconds
+            self.wait_max_ms = max(self.wait_max_ms, milliseconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f'<={bound}' for bound in WAIT_BUCKETS_MS] + [f'>{WAIT_BUCKETS_MS[-1]}']
+            return {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+                'overflow_connections': self.overflow_connections,
+                'timeouts': self.timeouts,
+                'wait_ms': {
+                    'count': self.wait_count,
+                    'mean': round(self.wait_total_ms / self.wait_count, 3) if self.wait_count else 0.0,
+                    'max': round(self.wait_max_ms, 3),
+                    'buckets': dict(zip(labels, self.wait_buckets))
+                }
+            }
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times every wait for a connection and counts overflow connections"""
+
+    metrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics:
+                self.metrics.observe_wait((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        if self.metrics:
+            self.metrics.observe_wait((time.perf_counter() - started) * 1000)
+        return entry
+
+    def _inc_overflow(self):
+        created = super()._inc_overflow()
+        # _overflow counts up from -pool_size, so above 0 means past pool_size
+        if created and self._overflow > 0 and self.metrics:
+            self.metrics.incr('overflow_connections')
+        return created
+
+    def recreate(self):
+        # Engine.dispose() swaps in a new pool; keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+def engine_options(database_uri, profile='development', environ=os.environ):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for a deployment profile with DB_POOL_* overrides.
+
+    SQLite gets none: its pools are not sized per worker.
+    """
+    if database_uri.startswith('sqlite'):
+        return {}
+    if profile not in POOL_PROFILES:
+        raise ValueError(f'Unknown DB_POOL_PROFILE {profile!r}, expected one of {", ".join(POOL_PROFILES)}')
+    options = dict(POOL_PROFILES[profile])
+    for name, key, cast in _OVERRIDES:
+        if environ.get(name):
+            options[key] = cast(environ[name])
+    options['poolclass'] = InstrumentedQueuePool
+    return options
+
+_metrics = weakref.WeakKeyDictionary()
+
+def instrument(engines):
+    """Count checkouts, connects and invalidations on ``{bind_key: engine}``"""
+    for engine in engines.values():
+        if engine in _metrics:
+            continue
+        metrics = _metrics[engine] = PoolMetrics()
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            engine.pool.metrics = metrics
+        event.listen(engine, 'checkout', lambda *args, metrics=metrics: metrics.incr('checkouts'))
+        event.listen(engine, 'checkin', lambda *args, metrics=metrics: metrics.incr('checkins'))
+        event.listen(engine, 'connect', lambda *args, metrics=metrics: metrics.incr('connects'))
+        event.listen(engine, 'invalidate', lambda *args, metrics=metrics: metrics.incr('invalidations'))
+        event.listen(engine, 'soft_invalidate', lambda *args, metrics=metrics: metrics.incr('soft_invalidations'))
+
+def pool_stats(engines):
+    """Current state and counters of each engine's pool, keyed by bind ('default' for the primary)"""
+    stats = {}
+    for bind_key, engine in engines.items():
+        pool = engine.pool
+        state = {'pool_class': type(pool).__name__, 'url': engine.url.render_as_string(hide_password=True)}
+        if isinstance(pool, QueuePool):
+            state.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow_in_use': max(pool.overflow(), 0),
+                'max_overflow': pool._max_overflow,
+                'timeout': pool.timeout()
+            })
+        metrics = _metrics.get(engine)
+        if metrics:
+            state.update(metrics.snapshot())
+        stats[bind_key or 'default'] = state
+    return stats
@@ -0,0 +1,174 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# A child of the app's logger, so lines go through Flask's handler
+logger = logging.getLogger(__name__)
+
+# A statement shape run this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+# Expanded IN lists and VALUES rows differ only in their length
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def statement_shape(statement):
+    """The statement with whitespace collapsed and placeholder lists folded to ``(...)``"""
+    return _PLACEHOLDER_LIST.sub('(...)', _WHITESPACE.sub(' ', statement).strip())
+
+class QueryLog:
+    """Statements run while the log is active on this thread, grouped by shape"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = Counter()
+        self.shape_ms = defaultdict(float)
+
+    def record(self, statement, milliseconds):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.total_ms += milliseconds
+        self.shapes[shape] += 1
+        self.shape_ms[shape] += milliseconds
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """``(shape, count, ms)`` of shapes run at least ``threshold`` times, most frequent first"""
+        return [(shape, count, self.shape_ms[shape]) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self, limit=5):
+        return '\n'.join(f'{count:>5} x {shape[:200]}' for shape, count in self.shapes.most_common(limit))
+
+class QueryTimer:
+    """Statement count and time only; cheap enough to run on every request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, statement, milliseconds):
+        self.count += 1
+        self.total_ms += milliseconds
+
+_active = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+def _logs():
+    logs = getattr(_active, 'logs', None)
+    if logs is None:
+        logs = _active.logs = []
+    return logs
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _logs():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    logs = _logs()
+    started = conn.info.get('query_started')
+    if not logs or not started:
+        return
+    milliseconds = (time.perf_counter() - started.pop()) * 1000
+    for log in logs:
+        log.record(statement, milliseconds)
+
+def _install():
+    # Listeners on the Engine class cover every engine, replicas included;
+    # with no active log they return after one attribute lookup
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if not _installed:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _installed = True
+
+def start(log):
+    """Feed the statements run on this thread to ``log`` (a ``QueryLog`` or ``QueryTimer``) until ``stop``"""
+    _install()
+    _logs().append(log)
+    return log
+
+def stop(log):
+    _logs().remove(log)
+
+@contextmanager
+def capture_queries():
+    """Collect the statements run on this thread inside the block into a ``QueryLog``"""
+    log = start(QueryLog())
+    try:
+        yield log
+    finally:
+        stop(log)
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None):
+    """Fail if the block runs more than ``max_queries`` statements.
+
+    ``max_repeats`` also caps how often any single statement shape may run,
+    which catches N+1 loops that stay under the total on small fixtures::
+
+        with query_budget(4, max_repeats=1):
+            client.get('/api/appointments/', headers=headers)
+    """
+    with capture_queries() as log:
+        yield log
+    if log.count > max_queries:
+        raise QueryBudgetExceeded(f'{log.count} queries, budget {max_queries}:\n{log.summary()}')
+    if max_repeats is not None and log.shapes and max(log.shapes.values()) > max_repeats:
+        raise QueryBudgetExceeded(f'a statement ran more than {max_repeats} times:\n{log.summary()}')
+
+def _start_profile():
+    g.sql_profile = (start(QueryLog()), time.perf_counter())
+
+def _finish_profile(response):
+    log, started = g.pop('sql_profile', (None, None))
+    if log is None:
+        return response
+    stop(log)
+    total_ms = (time.perf_counter() - started) * 1000
+    repeated = log.repeated(current_app.config.get('SQL_PROFILING_N_PLUS_ONE', N_PLUS_ONE_THRESHOLD))
+
+    response.headers.add('Server-Timing', f'db;dur={log.total_ms:.2f};desc="{log.count} queries"')
+    response.headers.add('Server-Timing', f'app;dur={max(total_ms - log.total_ms, 0):.2f}')
+    logger.log(logging.WARNING if repeated else logging.INFO, json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'queries': log.count,
+        'db_ms': round(log.total_ms, 2),
+        'total_ms': round(total_ms, 2),
+        'n_plus_one': [{'statement': shape[:300], 'count': count, 'ms': round(ms, 2)} for shape, count, ms in repeated]
+    }))
+    return response
+
+def _drop_profile(error=None):
+    # Requests that failed before after_request still leave the thread clean
+    log, _ = g.pop('sql_profile', (None, None))
+    if log is not None:
+        stop(log)
+
+def register_profiling(app):
+    """Count and time each request's SQL when ``SQL_PROFILING`` is on"""
+    if not app.config.get('SQL_PROFILING'):
+        return
+    # Creating app.logger attaches Flask's handler to the parent logger
+    app.logger
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_drop_profile)
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, jsonify, request
+
+# Distinct keys (IPs, emails) tracked per limiter; the least recently seen
+# key is evicted beyond this, so memory stays constant under a spray of IPs
+MAX_KEYS = 100000
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+def parse_rule(rule):
+    """``'5/minute'`` -> ``(5, 60)``"""
+    count, _, period = rule.partition('/')
+    try:
+        return int(count), _PERIODS[period.strip().rstrip('s')]
+    except (KeyError, ValueError):
+        raise ValueError(f'invalid rate limit {rule!r}, expected e.g. "5/minute"')
+
+class TokenBucketLimiter:
+    """Token buckets per key: ``count`` requests per ``period`` with bursts up to ``count``.
+
+    Each key costs two floats in an LRU-ordered dict capped at ``max_keys``.
+    """
+
+    def __init__(self, count, period, max_keys=MAX_KEYS):
+        self.capacity = float(count)
+        self.refill_per_second = count / period
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def hit(self, key):
+        """Take a token for ``key``; returns seconds to wait, 0 when allowed"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.capacity, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_second)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0
+            self.rejected += 1
+            return (1 - bucket[0]) / self.refill_per_second
+
+    def stats(self):
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'evicted': self.evicted,
+                'tracked_keys': len(self._buckets)
+            }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def _client_ip():
+    # Only trust X-Forwarded-For when the app sits behind a known proxy
+    if current_app.config.get('RATELIMIT_TRUST_PROXY'):
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def _email():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get('email'), str):
+        return data['email'].lower().strip() or None
+    return None
+
+# What each limit is keyed by
+KEY_FUNCTIONS = {
+    'ip': _client_ip,
+    'email': _email
+}
+
+def _limiter(endpoint, scope, rule):
+    name = f'{endpoint}:{scope}'
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = TokenBucketLimiter(
+                    *parse_rule(rule), max_keys=current_app.config.get('RATELIMIT_MAX_KEYS', MAX_KEYS)
+                )
+    return limiter
+
+def rate_limit(**default_rules):
+    """Throttle a view per client key before it runs, e.g. ``@rate_limit(ip='20/minute', email='5/minute')``.
+
+    Rules can be overridden per endpoint with ``RATE_LIMITS``, e.g.
+    ``{'auth.login': {'ip': '50/minute'}}``, and switched off with
+    ``RATELIMIT_ENABLED = False``. Limits are per worker process.
+    Rejections return 429 with ``Retry-After`` and touch neither the
+    database nor the password hasher.
+    """
+    for scope, rule in default_rules.items():
+        if scope not in KEY_FUNCTIONS:
+            raise ValueError(f'unknown rate limit key {scope!r}')
+        parse_rule(rule)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if config.get('RATELIMIT_ENABLED', True):
+                rules = dict(default_rules, **config.get('RATE_LIMITS', {}).get(request.endpoint, {}))
+                for scope, rule in rules.items():
+                    key = KEY_FUNCTIONS[scope]()
+                    if key is None:
+                        continue
+                    retry_after = _limiter(request.endpoint, scope, rule).hit(key)
+                    if retry_after:
+                        response = jsonify({'error': 'Too many requests, please retry later'})
+                        response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+                        return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def limiter_stats():
+    """Counters for every limiter created in this process, keyed ``endpoint:scope``"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in sorted(limiters.items())}
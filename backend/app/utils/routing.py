@@ -0,0 +1,202 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+# Blueprints whose GET requests may read from a replica
+REPLICA_BLUEPRINTS = ('appointments', 'dashboard', 'resources', 'users')
+
+# A replica that failed is left alone this long before it is probed again
+REPLICA_RETRY_SECONDS = 10
+
+# Healthy replicas are re-checked with SELECT 1 at most this often per worker
+REPLICA_CHECK_SECONDS = 30
+
+# Response header with the read-your-writes deadline, which the client
+# echoes on its next requests so every worker honours it. A header, not a
+# cookie: the SPA calls the API cross-origin without credentials
+STICKY_HEADER = 'X-Primary-Until'
+
+READ_METHODS = ('GET', 'HEAD')
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to the request's replica, everything else to the primary.
+
+    Flushes, DML and raw ``text()`` statements always use the primary, and
+    once the session has flushed or run any other statement in a request
+    the rest of its reads do too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False):
+            bind_key = _replica_for_request()
+            if bind_key is not None:
+                return self._db.engines[bind_key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _replica_for_request():
+    if not has_app_context() or g.get('db_wrote'):
+        return None
+    return g.get('db_replica')
+
+def _record_write():
+    if has_app_context():
+        g.db_wrote = True
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_flush(session, flush_context):
+    _record_write()
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _record_statement(orm_execute_state):
+    # Core insert()/update()/upserts executed on the session never flush
+    if not orm_execute_state.is_select:
+        _record_write()
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, e.g. for security-sensitive lookups"""
+    previous = g.get('db_replica')
+    g.db_replica = None
+    try:
+        yield
+    finally:
+        g.db_replica = previous
+
+class ReplicaRouter:
+    """Picks a healthy replica per request and remembers clients that just wrote.
+
+    State is per worker process; read-your-writes across workers relies on
+    the ``STICKY_HEADER`` the client sends back.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = 0
+        self._in_flight = {}
+        self._retry_at = {}
+        self._checked_at = {}
+        self._sticky = {}
+
+    def choose(self, engines, bind_keys, strategy='round_robin'):
+        """Bind key of the replica to read from, or None for the primary"""
+        now = time.monotonic()
+        healthy = [key for key in bind_keys if self._retry_at.get(key, 0) <= now and self._is_up(key, engines[key], now)]
+        if not healthy:
+            return None
+        with self._lock:
+            if strategy == 'least_loaded':
+                bind_key = min(healthy, key=lambda key: self._in_flight.get(key, 0))
+            else:
+                bind_key = healthy[self._next % len(healthy)]
+                self._next += 1
+            self._in_flight[bind_key] = self._in_flight.get(bind_key, 0) + 1
+        return bind_key
+
+    def release(self, bind_key):
+        with self._lock:
+            self._in_flight[bind_key] = max(self._in_flight.get(bind_key, 0) - 1, 0)
+
+    def _is_up(self, bind_key, engine, now):
+        # Probes run outside the lock; two requests may both probe, which is harmless
+        if now - self._checked_at.get(bind_key, float('-inf')) < REPLICA_CHECK_SECONDS:
+            return True
+        self._checked_at[bind_key] = now
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception:
+            current_app.logger.warning('Replica %s failed its health check; reading from the primary', bind_key)
+            self.mark_down(bind_key)
+            return False
+        self._retry_at.pop(bind_key, None)
+        return True
+
+    def mark_down(self, bind_key):
+        self._retry_at[bind_key] = time.monotonic() + REPLICA_RETRY_SECONDS
+        # Probe again as soon as the retry time is reached
+        self._checked_at.pop(bind_key, None)
+
+    def stick(self, client, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._sticky[client] = now + seconds
+            # Drop expired clients now and then so the map stays small
+            if len(self._sticky) > 10000:
+                self._sticky = {key: until for key, until in self._sticky.items() if until > now}
+
+    def is_sticky(self, client):
+        return self._sticky.get(client, 0) > time.monotonic()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'in_flight': dict(self._in_flight),
+                'down': sorted(key for key, retry_at in self._retry_at.items() if retry_at > now),
+                'sticky_clients': sum(1 for until in self._sticky.values() if until > now)
+            }
+
+replica_router = ReplicaRouter()
+
+def _client_key():
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return hashlib.blake2b(authorization.encode(), digest_size=16).hexdigest()
+
+def _recently_wrote():
+    try:
+        if float(request.headers.get(STICKY_HEADER, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    client = _client_key()
+    return client is not None and replica_router.is_sticky(client)
+
+def _route_request():
+    if request.method not in READ_METHODS or request.blueprint not in REPLICA_BLUEPRINTS or _recently_wrote():
+        return
+    bind_keys = current_app.config['REPLICA_BINDS']
+    strategy = current_app.config.get('REPLICA_SELECTION', 'round_robin')
+    g.db_replica = replica_router.choose(current_app.extensions['sqlalchemy'].engines, bind_keys, strategy)
+
+def _remember_writes(response):
+    # Any successful write request counts: a statement run on its own
+    # connection would not pass through the session's listeners
+    if request.method not in READ_METHODS and response.status_code < 400:
+        seconds = current_app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+        client = _client_key()
+        if client is not None:
+            replica_router.stick(client, seconds)
+        response.headers[STICKY_HEADER] = f'{time.time() + seconds:.3f}'
+    return response
+
+def _release_replica(error=None):
+    bind_key = g.pop('db_replica', None)
+    if bind_key is not None:
+        replica_router.release(bind_key)
+
+def register_replica_routing(app, engines):
+    """Route reads of ``REPLICA_BLUEPRINTS`` to the ``REPLICA_BINDS`` engines of ``app``"""
+    bind_keys = app.config.get('REPLICA_BINDS')
+    if not bind_keys:
+        return
+    missing = [key for key in bind_keys if key not in engines]
+    if missing:
+        raise ValueError(f'REPLICA_BINDS not in SQLALCHEMY_BINDS: {", ".join(missing)}')
+
+    for bind_key in bind_keys:
+        @event.listens_for(engines[bind_key], 'handle_error')
+        def _replica_failed(context, bind_key=bind_key):
+            # Lost or refused connections take the replica out of rotation;
+            # the failing request still errors, the following ones use the primary
+            if not context.is_pre_ping and (context.is_disconnect or context.connection is None):
+                replica_router.mark_down(bind_key)
+
+    app.before_request(_route_request)
+    app.after_request(_remember_writes)
+    app.teardown_request(_release_replica)
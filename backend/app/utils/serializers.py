@@ -0,0 +1,120 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional; the standard library encoder is used without it
+    orjson = None
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+def _hhmm(value):
+    return value.strftime('%H:%M') if value is not None else None
+
+def _float(value):
+    return float(value) if value is not None else None
+
+# Names available to the generated extractors
+_HELPERS = {'_iso': _iso, '_hhmm': _hhmm, '_float': _float}
+
+class Field:
+    """An output field: the SQL columns it needs and a Python expression over ``row``"""
+    __slots__ = ('columns', 'expression')
+
+    def __init__(self, columns, expression):
+        self.columns = tuple(columns)
+        self.expression = expression
+
+def column_field(column):
+    """Field that copies one mapped column, converting dates, times and decimals"""
+    key = column.key
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+    if python_type in (date, datetime):
+        expression = f'_iso(row.{key})'
+    elif python_type is time:
+        expression = f'_hhmm(row.{key})'
+    elif python_type is Decimal:
+        expression = f'_float(row.{key})'
+    else:
+        expression = f'row.{key}'
+    return Field((column,), expression)
+
+def column_fields(model, names):
+    return [(name, column_field(getattr(model, name))) for name in names]
+
+class ModelSerializer:
+    """Turns ORM objects or projected rows into dicts with a generated extractor per field set.
+
+    ``fields`` is a list of ``(name, Field)``. Fields in ``required`` are
+    always selected, e.g. the keys a list is ordered and paginated by.
+    ``helpers`` are extra functions the field expressions may call.
+    """
+
+    def __init__(self, fields, required=('id',), helpers=None):
+        self.fields = dict(fields)
+        self.required = tuple(required)
+        self.helpers = dict(_HELPERS, **(helpers or {}))
+        self.all_fields = tuple(self.fields)
+        self._compile = lru_cache(maxsize=64)(self._build)
+
+    def select(self, spec):
+        """Field names from a ``fields=a,b,c`` parameter; all fields when empty.
+
+        Raises ValueError naming any unknown field.
+        """
+        if not spec:
+            return self.all_fields
+        wanted = {name.strip() for name in spec.split(',') if name.strip()}
+        unknown = wanted.difference(self.fields)
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        wanted.update(self.required)
+        return tuple(name for name in self.all_fields if name in wanted)
+
+    def columns(self, names):
+        """The distinct SQL columns needed to produce ``names``, for ``with_entities``"""
+        columns = []
+        for name in names:
+            for column in self.fields[name].columns:
+                if not any(column is seen for seen in columns):
+                    columns.append(column)
+        return columns
+
+    def _build(self, names):
+        body = ', '.join(f'{name!r}: {self.fields[name].expression}' for name in names)
+        namespace = dict(self.helpers)
+        exec(f'def extract(row):\n    return {{{body}}}', namespace)
+        return namespace['extract']
+
+    def extractor(self, names=None):
+        """A function ``row -> dict`` for the given field names, built once per set"""
+        return self._compile(tuple(names) if names is not None else self.all_fields)
+
+    def __call__(self, row, names=None):
+        return self.extractor(names)(row)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when it is installed.
+
+    Dates and datetimes still go through ``default`` so responses are
+    byte-for-byte what the standard provider would send, minus whitespace
+    and ASCII escaping. Anything orjson refuses falls back to the
+    standard encoder.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and set(kwargs) <= {'separators', 'indent'}:
+            option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode()
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
@@ -0,0 +1,82 @@
+"""Production serving: ``gunicorn -c gunicorn.conf.py main:app``
+
+The app and every route module are imported once in the master before
+workers fork (``preload_app``), so workers share that memory copy-on-write
+instead of each importing it again. Settings come from the environment.
+"""
+import gc
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5001')}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# The notification stream holds a connection per browser, so workers are
+# cooperative by default; set WORKER_CLASS=sync when streams are served elsewhere
+worker_class = os.getenv('WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('WORKER_CONNECTIONS', 1000))
+threads = int(os.getenv('THREADS', 1))
+
+preload_app = os.getenv('PRELOAD_APP', '1') == '1'
+timeout = int(os.getenv('TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.getenv('MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.getenv('ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
+
+# Preloading imports the route modules in the master, which is the point;
+# without it each worker loads them on its first request
+os.environ.setdefault('LAZY_BLUEPRINTS', '0' if preload_app else '1')
+
+# One request at a time needs only a small pool per worker; gevent workers
+# interleave many
+os.environ.setdefault('DB_POOL_PROFILE', 'gevent' if worker_class == 'gevent' else 'production')
+
+# Each worker would start its own password hashing pool. Sync workers hash
+# inline, which already bounds the host to one hash per worker; gevent
+# workers need the pool so a hash does not stall every greenlet, and split
+# the cores between them, so the host runs max(cores, workers) hashers
+os.environ.setdefault('PASSWORD_HASH_WORKERS', str(
+    max(multiprocessing.cpu_count() // workers, 1) if worker_class == 'gevent' else 0
+))
+
+# Workers write their metrics here so any of them can answer /metrics for all
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'harms-metrics-{os.getpid()}'))
+
+if worker_class == 'gevent' and preload_app:
+    # Patch before the app is imported so the locks and sockets created at
+    # import time are cooperative in every worker
+    from gevent import monkey
+    monkey.patch_all()
+
+def on_starting(server):
+    # Counters restart with the server, as Prometheus expects
+    from app.utils.metrics import reset
+    reset(os.environ['METRICS_DIR'])
+
+def when_ready(server):
+    # Keep the preloaded objects out of the collector so its bookkeeping
+    # writes do not un-share their pages in the workers
+    if preload_app:
+        gc.freeze()
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared between workers
+    if preload_app:
+        from main import app
+        from app import db
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+def child_exit(server, worker):
+    # Keep a recycled worker's counts; its gauges went with it
+    from app.utils.metrics import retire
+    retire(worker.pid, os.environ['METRICS_DIR'])
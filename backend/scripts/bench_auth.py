@@ -0,0 +1,115 @@
+"""Throughput and tail latency of /api/auth/login and /api/auth/register under concurrency.
+
+    python scripts/bench_auth.py --concurrency 1 8 32 64 --requests 200
+    python scripts/bench_auth.py --hash-workers 0      # hash inline on the request thread
+    python scripts/bench_auth.py --hash-method pbkdf2:sha256:600000
+
+Runs the app behind a threaded HTTP server in this process and drives it
+with one client thread per concurrent caller. Defaults to a throwaway
+SQLite file; set DATABASE_URL to measure against MySQL.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from werkzeug.serving import make_server
+from common import build_app
+from app import db
+
+PASSWORD = 'benchmark-password'
+
+def seed(app, users):
+    from app.models.user import User
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(email='template@bench.harms.com', first_name='Bench', last_name='User', role='patient')
+        user.set_password(PASSWORD)
+        # Every seeded account shares one hash so seeding does not dominate the run
+        db.session.add_all([User(
+            email=f'user{i}@bench.harms.com', password_hash=user.password_hash,
+            first_name='Bench', last_name=str(i), role='patient'
+        ) for i in range(users)])
+        db.session.commit()
+
+def run(port, concurrency, requests, make_body, path):
+    statuses = Counter()
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+    barrier = threading.Barrier(concurrency)
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        barrier.wait()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            body = json.dumps(make_body(i))
+            started = time.perf_counter()
+            conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses[response.status] += 1
+                latencies.append(elapsed)
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return statuses, len(latencies) / wall, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and concurrency level')
+    parser.add_argument('--hash-workers', type=int, default=None, help='PASSWORD_HASH_WORKERS (0 = inline)')
+    parser.add_argument('--hash-method', default=None, help='PASSWORD_HASH_METHOD')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    database_url = os.getenv('DATABASE_URL') or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'auth.db')
+    app = build_app(database_url)
+    # Every request comes from 127.0.0.1; measure hashing, not the login throttle
+    app.config['RATELIMIT_ENABLED'] = False
+    if args.hash_workers is not None:
+        app.config['PASSWORD_HASH_WORKERS'] = args.hash_workers
+    if args.hash_method:
+        app.config['PASSWORD_HASH_METHOD'] = args.hash_method
+    seed(app, max(args.concurrency))
+
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f'{"endpoint":>9} {"conc":>5} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8}  statuses')
+    run_id = 0
+    for concurrency in args.concurrency:
+        run_id += 1
+        login = lambda i: {'email': f'user{i % concurrency}@bench.harms.com', 'password': PASSWORD}
+        register = lambda i, run_id=run_id: {
+            'email': f'new{run_id}-{i}@bench.harms.com', 'password': PASSWORD,
+            'first_name': 'New', 'last_name': str(i), 'role': 'patient'
+        }
+        for name, make_body, path in (('login', login, '/api/auth/login'), ('register', register, '/api/auth/register')):
+            statuses, throughput, p50, p99 = run(args.port, concurrency, args.requests, make_body, path)
+            print(f'{name:>9} {concurrency:>5} {throughput:>8.1f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f}  {dict(sorted(statuses.items()))}')
+    server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Startup time and per-worker memory of the API, lazy vs eager route loading.
+
+    python scripts/bench_startup.py                      # fresh interpreters, lazy vs eager
+    python scripts/bench_startup.py --gunicorn 4         # 4 gunicorn workers, preload on vs off
+
+The first mode starts a new interpreter per run and reports the time to
+import ``main`` (which calls ``create_app``), the latency of the first
+request and the RSS after each. The gunicorn mode starts the server with
+``gunicorn.conf.py``, waits for /api/ready, warms every worker and reads
+each process's Pss and private memory from /proc (Linux only). Pss splits
+shared pages between the processes sharing them, so its sum is the real
+footprint of the whole server.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = r'''
+import json, sys, time
+def rss_kb():
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('VmRSS'))
+started = time.perf_counter()
+import main
+created = time.perf_counter()
+after_create = rss_kb()
+route_modules = sum(1 for name in sys.modules if name.startswith('app.routes.'))
+client = main.app.test_client()
+response = client.get('/api/ready')
+first = time.perf_counter()
+print(json.dumps({
+    'create_ms': (created - started) * 1000,
+    'first_request_ms': (first - created) * 1000,
+    'status': response.status_code,
+    'rss_create_kb': after_create,
+    'rss_first_kb': rss_kb(),
+    'route_modules': route_modules
+}))
+'''
+
+def run_probe(lazy, database_url):
+    env = dict(os.environ, LAZY_BLUEPRINTS='1' if lazy else '0', DATABASE_URL=database_url)
+    output = subprocess.run(
+        [sys.executable, '-c', _PROBE], cwd=BACKEND, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def interpreters(runs, database_url):
+    print(f'{"mode":>6} {"create ms":>10} {"1st req ms":>11} {"RSS MB":>8} {"RSS after 1st":>14} {"route modules":>14}')
+    for lazy in (True, False):
+        results = [run_probe(lazy, database_url) for _ in range(runs)]
+        create = statistics.median(r['create_ms'] for r in results)
+        first = statistics.median(r['first_request_ms'] for r in results)
+        rss = statistics.median(r['rss_create_kb'] for r in results) / 1024
+        rss_first = statistics.median(r['rss_first_kb'] for r in results) / 1024
+        print(f'{"lazy" if lazy else "eager":>6} {create:>10.1f} {first:>11.1f} {rss:>8.1f} {rss_first:>14.1f} {results[0]["route_modules"]:>14}')
+
+def _memory_kb(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return fields['Rss'], fields['Pss'], fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+
+def _children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as children:
+        return [int(child) for child in children.read().split()]
+
+def _get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+def gunicorn(workers, port, worker_class, database_url):
+    print(f'{"preload":>8} {"ready s":>8} {"workers":>8} {"RSS MB":>8} {"Pss MB":>8} {"private MB":>11} {"private/worker":>15}')
+    for preload in ('1', '0'):
+        env = dict(os.environ, PRELOAD_APP=preload, WEB_CONCURRENCY=str(workers), WORKER_CLASS=worker_class,
+                   BIND=f'127.0.0.1:{port}', ACCESS_LOG='/dev/null', DATABASE_URL=database_url)
+        env.pop('LAZY_BLUEPRINTS', None)
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+            cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while True:
+                try:
+                    if _get(port, '/api/ready') == 200:
+                        break
+                except OSError:
+                    pass
+                if server.poll() is not None:
+                    raise SystemExit('gunicorn exited; run it by hand to see why')
+                time.sleep(0.05)
+            while len(_children(server.pid)) < workers:
+                time.sleep(0.05)
+            ready = time.perf_counter() - started
+            # Give every worker a request so lazily loaded routes are counted
+            for _ in range(workers * 8):
+                _get(port, '/api/ready')
+
+            pids = [server.pid] + _children(server.pid)
+            memory = [_memory_kb(pid) for pid in pids]
+            rss = sum(m[0] for m in memory) / 1024
+            pss = sum(m[1] for m in memory) / 1024
+            private = sum(m[2] for m in memory) / 1024
+            per_worker = statistics.mean(m[2] for m in memory[1:]) / 1024
+            print(f'{"on" if preload == "1" else "off":>8} {ready:>8.2f} {len(pids) - 1:>8} {rss:>8.1f} {pss:>8.1f} {private:>11.1f} {per_worker:>15.1f}')
+        finally:
+            server.terminate()
+            server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='interpreters started per mode')
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS', help='measure a gunicorn server with this many workers')
+    parser.add_argument('--worker-class', default='sync')
+    parser.add_argument('--port', type=int, default=5098)
+    args = parser.parse_args()
+
+    database_url = os.getenv('DATABASE_URL') or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db')
+    if args.gunicorn:
+        gunicorn(args.gunicorn, args.port, args.worker_class, database_url)
+    else:
+        interpreters(args.runs, database_url)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""Shared setup for the benchmark and stress scripts in this directory."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+
+def build_app(database_url):
+    config = {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'JWT_SECRET_KEY': 'benchmark-secret-key-of-adequate-length',
+        'LAZY_BLUEPRINTS': False
+    }
+    if database_url.startswith('sqlite'):
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    return create_app(config)
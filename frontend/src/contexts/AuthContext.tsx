@@ -72,11 +72,12 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
   const login = async (email: string, password: string) => {
     try {
       const response = await authService.login(email, password);
-      const { user: userData, access_token } = response;
+      const { user: userData, access_token, refresh_token } = response;
       
       setUser(userData);
       setToken(access_token);
       localStorage.setItem('token', access_token);
+      localStorage.setItem('refreshToken', refresh_token);
     } catch (error) {
       throw error;
     }
@@ -85,20 +86,24 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
   const register = async (userData: RegisterData) => {
     try {
       const response = await authService.register(userData);
-      const { user: newUser, access_token } = response;
+      const { user: newUser, access_token, refresh_token } = response;
       
       setUser(newUser);
       setToken(access_token);
       localStorage.setItem('token', access_token);
+      localStorage.setItem('refreshToken', refresh_token);
     } catch (error) {
       throw error;
     }
   };
 
   const logout = () => {
+    // Revoke both tokens server-side; sign out locally regardless
+    authService.logout().catch(() => undefined);
     setUser(null);
     setToken(null);
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
   };
 
   const value = {
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import { useNotification } from '../contexts/NotificationContext';
-import { apiService } from '../services/api';
+import { apiService, NotificationStream } from '../services/api';
 import { DashboardStats, Appointment, Notification as AppNotification } from '../types';
 import {
   CalendarIcon,
@@ -21,10 +21,25 @@ const Dashboard: React.FC = () => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    fetchDashboardData();
+    let stream: NotificationStream | undefined;
+    let unmounted = false;
+    fetchDashboardData().then((latestId) => {
+      // The page may have been left while the data loaded
+      if (unmounted) {
+        return;
+      }
+      // New notifications are pushed instead of polled
+      stream = apiService.openNotificationStream((notification) => {
+        setNotifications(prev => [notification, ...prev]);
+      }, latestId);
+    });
+    return () => {
+      unmounted = true;
+      stream?.close();
+    };
   }, []);
 
-  const fetchDashboardData = async () => {
+  const fetchDashboardData = async (): Promise<number | undefined> => {
     try {
       const [statsResponse, notificationsResponse] = await Promise.all([
         apiService.getDashboardStats(),
@@ -33,6 +48,7 @@ const Dashboard: React.FC = () => {
 
       setStats(statsResponse.stats);
       setNotifications(notificationsResponse.notifications || []);
+      return notificationsResponse.notifications?.[0]?.id ?? 0;
     } catch (error: any) {
       addNotification({
         type: 'error',
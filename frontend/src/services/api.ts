@@ -2,11 +2,13 @@ import axios, { AxiosInstance, AxiosResponse } from 'axios';
 import { 
   ApiResponse, 
   LoginResponse, 
+  TokenResponse,
   AppointmentsResponse, 
   DoctorsResponse, 
   AvailableSlotsResponse, 
   DashboardResponse,
   NotificationsResponse,
+  Notification,
   User,
   Appointment,
   Resource
@@ -14,8 +16,34 @@ import {
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5001/api';
 
+// Delay before the notification stream reconnects, doubled per failed
+// attempt up to the maximum
+const STREAM_RETRY_MS = 3000;
+const STREAM_MAX_RETRY_MS = 60000;
+
+// The stream's token is refreshed first when it expires within this margin
+const STREAM_TOKEN_MARGIN_MS = 30000;
+
+export interface NotificationStream {
+  close(): void;
+}
+
+const tokenExpiresSoon = (token: string): boolean => {
+  try {
+    const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+    return !payload.exp || payload.exp * 1000 - Date.now() < STREAM_TOKEN_MARGIN_MS;
+  } catch (error) {
+    return true;
+  }
+};
+
+// Read-your-writes deadline set by the API after a write; echoed back so
+// every backend worker reads this client's data from the primary until then
+const PRIMARY_UNTIL_HEADER = 'x-primary-until';
+
 class ApiService {
   private api: AxiosInstance;
+  private primaryUntil: string | null = null;
 
   constructor() {
     this.api = axios.create({
@@ -32,6 +60,9 @@ class ApiService {
         if (token) {
           config.headers.Authorization = `Bearer ${token}`;
         }
+        if (this.primaryUntil) {
+          config.headers[PRIMARY_UNTIL_HEADER] = this.primaryUntil;
+        }
         return config;
       },
       (error: any) => {
@@ -42,12 +73,29 @@ class ApiService {
     // Response interceptor to handle errors
     this.api.interceptors.response.use(
       (response: AxiosResponse) => {
+        const primaryUntil = response.headers[PRIMARY_UNTIL_HEADER];
+        if (primaryUntil) {
+          this.primaryUntil = primaryUntil;
+        }
         return response;
       },
-      (error: any) => {
+      async (error: any) => {
+        const original = error.config;
+        if (error.response?.status === 401 && original && !original._retried && localStorage.getItem('refreshToken')) {
+          // Access token expired: rotate the refresh token once and retry
+          original._retried = true;
+          try {
+            const { access_token } = await this.refreshToken();
+            original.headers.Authorization = `Bearer ${access_token}`;
+            return this.api(original);
+          } catch (refreshError) {
+            // Fall through to signing out
+          }
+        }
         if (error.response?.status === 401) {
           // Token expired or invalid
           localStorage.removeItem('token');
+          localStorage.removeItem('refreshToken');
           window.location.href = '/login';
         }
         return Promise.reject(error);
@@ -91,12 +139,32 @@ class ApiService {
     return this.get('/auth/me');
   }
 
-  async refreshToken() {
-    return this.post('/auth/refresh');
+  // Shared so concurrent 401s wait on a single rotation
+  private refreshing: Promise<TokenResponse> | null = null;
+
+  async refreshToken(): Promise<TokenResponse> {
+    if (!this.refreshing) {
+      const refreshToken = localStorage.getItem('refreshToken') || '';
+      this.refreshing = axios.post(`${API_BASE_URL}/auth/refresh`, null, {
+        headers: { Authorization: `Bearer ${refreshToken}` },
+      }).then((response: AxiosResponse<TokenResponse>) => {
+        localStorage.setItem('token', response.data.access_token);
+        localStorage.setItem('refreshToken', response.data.refresh_token);
+        return response.data;
+      }).finally(() => {
+        this.refreshing = null;
+      });
+    }
+    return this.refreshing;
   }
 
   async logout() {
-    return this.post('/auth/logout');
+    // Read both tokens now; the caller clears storage without waiting
+    const token = localStorage.getItem('token');
+    const response = await this.api.post('/auth/logout', { refresh_token: localStorage.getItem('refreshToken') }, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    return response.data;
   }
 
   // Appointments
@@ -197,6 +265,62 @@ class ApiService {
     const response = await this.api.get('/dashboard/notifications');
     return response.data;
   }
+
+  // Server-Sent Events stream of new notifications. The server ends the
+  // stream when its token expires, and EventSource would retry with the same
+  // ?jwt= forever, so every reconnect is made here with the current token,
+  // refreshed first when it is about to expire, resuming after the last event
+  openNotificationStream(onNotification: (notification: Notification) => void, lastEventId?: number): NotificationStream {
+    let source: EventSource | null = null;
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    let closed = false;
+    let retryDelay = STREAM_RETRY_MS;
+
+    const connect = async () => {
+      let token = localStorage.getItem('token') || '';
+      if (tokenExpiresSoon(token) && localStorage.getItem('refreshToken')) {
+        try {
+          token = (await this.refreshToken()).access_token;
+        } catch (error) {
+          // The refresh token is gone too; the next API call signs out
+          return;
+        }
+      }
+      if (closed) {
+        return;
+      }
+      const params = new URLSearchParams({ jwt: token });
+      if (lastEventId !== undefined) {
+        params.set('last_event_id', String(lastEventId));
+      }
+      source = new EventSource(`${API_BASE_URL}/dashboard/notifications/stream?${params.toString()}`);
+      source.addEventListener('open', () => {
+        retryDelay = STREAM_RETRY_MS;
+      });
+      source.addEventListener('notification', (event) => {
+        const message = event as MessageEvent;
+        lastEventId = Number(message.lastEventId) || lastEventId;
+        onNotification(JSON.parse(message.data));
+      });
+      source.onerror = () => {
+        source?.close();
+        source = null;
+        if (!closed) {
+          timer = setTimeout(connect, retryDelay);
+          retryDelay = Math.min(retryDelay * 2, STREAM_MAX_RETRY_MS);
+        }
+      };
+    };
+
+    connect();
+    return {
+      close: () => {
+        closed = true;
+        clearTimeout(timer);
+        source?.close();
+      }
+    };
+  }
 }
 
 export const apiService = new ApiService();
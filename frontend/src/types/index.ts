@@ -104,11 +104,13 @@ export interface DashboardStats {
 }
 
 export interface Notification {
-  type: 'appointment_reminder' | 'low_stock' | 'expired' | 'general';
+  id?: number;
+  type: 'appointment_reminder' | 'appointment_booked' | 'appointment_confirmed' | 'appointment_cancelled' | 'low_stock' | 'expired' | 'general';
   title: string;
   message: string;
   date: string;
   priority: 'low' | 'medium' | 'high';
+  read?: boolean;
 }
 
 export interface ApiResponse<T> {
@@ -125,6 +127,12 @@ export interface ApiResponse<T> {
 export interface LoginResponse {
   user: User;
   access_token: string;
+  refresh_token: string;
+}
+
+export interface TokenResponse {
+  access_token: string;
+  refresh_token: string;
 }
 
 export interface AppointmentsResponse {
@@ -135,6 +143,7 @@ export interface AppointmentsResponse {
 
 export interface DoctorsResponse {
   doctors: User[];
+  specialties: string[];
 }
 
 export interface AvailableSlotsResponse {
@@ -148,4 +157,7 @@ export interface DashboardResponse {
 
 export interface NotificationsResponse {
   notifications: Notification[];
+  last_read_id?: number;
+  unread_count?: number;
+  has_more?: boolean;
 }